@@ -0,0 +1,209 @@
+"""
+Points de reprise de l'interpréteur.
+Un fichier de points de reprise est une suite d'enregistrements (taille sur 4 octets, puis
+dictionnaire sérialisé par marshal, qui n'exécute pas de code à la relecture, et compressé avec
+zlib) auquel on ne fait qu'ajouter. Un enregistrement tronqué ou corrompu en fin de fichier (écriture
+interrompue) est ignoré à la relecture, puis écrasé par le point de reprise suivant. Le ruban y est découpé
+en pages de PAGE_SIZE cases alignées sur les positions absolues, et chaque enregistrement ne
+contient que les pages modifiées depuis le précédent : la reprise relit donc tout le fichier.
+Les états sont enregistrés par leur indice dans la machine (les m-fonctions pouvant être
+surchargées) et leur nom, les instances de m-fonction par une table de leurs arguments, où chaque
+instance n'apparaît qu'une fois (voir encode_states).
+"""
+
+import hashlib
+import marshal
+import os
+import struct
+import typing as th
+import zlib
+from array import array
+
+from .ir import State, StateInstance, AMachine
+from .tape import BaseTape
+
+PAGE_SIZE = 4096
+HEADER = struct.Struct('>I')
+MARSHAL_VERSION = 4
+
+StateRow = tuple # (indice, nom, arguments...) où un argument est un symbole (str) ou un numéro de ligne
+
+
+def machine_states(machine:AMachine) -> list[State]:
+  """
+  États et m-fonctions de `machine`, indexés comme dans les points de reprise
+  """
+  return [State.ACCEPT, State.REJECT] + list(machine.states)
+
+def encode_states(states:list[State|None], index:dict[State, int]) -> tuple[list[StateRow], list[int|None]]:
+  """
+  Table des états `states` et de leurs arguments : une ligne (indice, nom de la m-fonction, valeurs
+  des arguments...) par instance distincte, (indice, nom) par état simple, un argument étant un
+  symbole (str) ou le numéro de la ligne d'un état, toujours antérieure. La table est construite
+  sans récursion, chaque instance partagée n'y figurant qu'une fois. Retourne la table et les
+  numéros des lignes de `states` (None pour None)
+  """
+  rows = [] # type: list[StateRow]
+  row = {} # type: dict[State, int]
+  for state in states :
+    stack = [state] if state is not None else []
+    while stack :
+      s = stack[-1]
+      if s in row :
+        stack.pop()
+        continue
+      values = s.values if isinstance(s, StateInstance) else ()
+      pending = [ v for v in values if not isinstance(v, str) and v not in row ]
+      if pending :
+        stack.extend(pending)
+        continue
+      stack.pop()
+      t = s.template if isinstance(s, StateInstance) else s
+      row[s] = len(rows)
+      rows.append((index[t], t.name) + tuple( v if isinstance(v, str) else row[v] for v in values ))
+  return rows, [ row[s] if s is not None else None for s in states ]
+
+def decode_states(rows:list[StateRow], states:list[State]) -> list[State]:
+  """
+  États des lignes de la table `rows` (voir encode_states)
+  """
+  rv = []
+  for i, name, *values in rows :
+    if i >= len(states) or states[i].name != name :
+      raise ValueError(f'The checkpoint does not match the machine (state {name})')
+    rv.append(states[i].instanciate(tuple( v if isinstance(v, str) else rv[v] for v in values )))
+  return rv
+
+def split_pages(tape:BaseTape) -> dict[int, bytes]:
+  """
+  Découpe la fenêtre utilisée du ruban en pages (complétées par des cases vides)
+  """
+  cell = 2 if tape.wide else 1
+  size = PAGE_SIZE * cell
+  first = tape.position(0)
+  p0 = first // PAGE_SIZE
+  data = bytes((first - p0 * PAGE_SIZE) * cell) + tape.tobytes()
+  data += bytes(-len(data) % size)
+  return { p0 + i: data[i * size:(i + 1) * size] for i in range(len(data) // size) }
+
+def digest(page:bytes) -> bytes:
+  return hashlib.blake2b(page, digest_size=16).digest()
+
+def write_record(path:str, record:dict, end:int=None):
+  """
+  Ajoute `record` à `path` et le force sur le disque. Si `end` est donné, le fichier est d'abord
+  tronqué à cette taille (fin du dernier enregistrement complet, voir scan_records)
+  """
+  payload = zlib.compress(marshal.dumps(record, MARSHAL_VERSION))
+  with open(path, 'r+b' if end is not None else 'ab') as f :
+    if end is not None :
+      f.truncate(end)
+      f.seek(end)
+    f.write(HEADER.pack(len(payload)) + payload)
+    f.flush()
+    os.fsync(f.fileno())
+
+def scan_records(path:str) -> th.Iterator[tuple[dict, int]]:
+  """
+  Enregistrements de `path`, chacun avec la position de sa fin dans le fichier. S'arrête au premier
+  enregistrement incomplet ou illisible
+  """
+  with open(path, 'rb') as f :
+    while True :
+      header = f.read(HEADER.size)
+      if len(header) < HEADER.size :
+        return
+      size, = HEADER.unpack(header)
+      payload = f.read(size)
+      if len(payload) < size :
+        return
+      try :
+        record = marshal.loads(zlib.decompress(payload))
+      except (zlib.error, EOFError, ValueError, TypeError) :
+        return
+      if not isinstance(record, dict) :
+        return
+      yield record, f.tell()
+
+def read_records(path:str) -> th.Iterator[dict]:
+  for record, _ in scan_records(path) :
+    yield record
+
+
+class Checkpointer(object):
+  """
+  Écrit les points de reprise successifs d'un Interpreter dans `path`. `digests` donne l'empreinte
+  (blake2b) de chaque page telle qu'enregistrée dans le fichier, les pages absentes étant vides.
+  `end`, s'il est donné, est la fin du dernier enregistrement complet : la suite du fichier est
+  écrasée par le prochain point de reprise.
+  """
+  def __init__(self, path:str, digests:dict[int, bytes]=None, end:int=None):
+    self.path = path
+    self.digests = digests if digests is not None else {}
+    self.end = end
+    self.index = None # type: dict[State, int]
+
+  def write(self, interp):
+    if self.index is None :
+      self.index = { s: i for i, s in enumerate(machine_states(interp.machine)) }
+    tape = interp.tape
+    pages = {}
+    blank = digest(bytes(PAGE_SIZE * (2 if tape.wide else 1)))
+    for p, data in split_pages(tape).items() :
+      d = digest(data)
+      if d != self.digests.get(p, blank) :
+        pages[p] = data
+        self.digests[p] = d
+    rows, (state, previous_state) = encode_states([interp.state, interp.previous_state], self.index)
+    write_record(self.path, {
+      'steps': interp.steps,
+      'counts': interp.counts,
+      'low': tape.low,
+      'high': tape.high,
+      'peak': tape.peak,
+      'head': interp.head,
+      'start': tape.position(0),
+      'length': len(tape),
+      'wide': tape.wide,
+      'symbols': interp.alphabet.symbols,
+      'states': rows,
+      'state': state,
+      'previous_state': previous_state,
+      'pages': pages,
+    }, self.end)
+    self.end = None
+
+
+def load(path:str, machine:AMachine) -> tuple[dict, list[int], Checkpointer]:
+  """
+  Relit le fichier de points de reprise `path`. Retourne le dernier enregistrement (états décodés),
+  les codes de la fenêtre du ruban dans l'alphabet de `machine`, et le Checkpointer permettant de
+  poursuivre le fichier
+  """
+  alphabet = machine.alphabet
+  pages = {}
+  digests = {}
+  record = None
+  end = 0
+  for record, end in scan_records(path) :
+    table = [ alphabet.encode(s) for s in record['symbols'] ]
+    for p, data in record['pages'].items() :
+      digests[p] = digest(data)
+      codes = array('H', data) if record['wide'] else data
+      pages[p] = [ table[c] for c in codes ]
+  if record is None :
+    raise ValueError(f'No checkpoint in {path}')
+  start = record['start']
+  stop = start + record['length']
+  codes = []
+  for p in range(start // PAGE_SIZE, -(-stop // PAGE_SIZE)) :
+    base = p * PAGE_SIZE
+    page = pages.get(p)
+    lo = max(start, base) - base
+    hi = min(stop, base + PAGE_SIZE) - base
+    codes.extend(page[lo:hi] if page is not None else [0] * (hi - lo))
+  states = machine_states(machine)
+  table = decode_states(record['states'], states)
+  record['state'] = table[record['state']]
+  record['previous_state'] = table[record['previous_state']] if record['previous_state'] is not None else None
+  return record, codes, Checkpointer(path, digests, end)
@@ -8,7 +8,8 @@ from .parsing.ast import ASTBuilder, PrettyPrinter
 
 from . import parse, buildAST, buildIR
 
-from .runtime import CLI
+from .runtime import CLI, ENGINES
+from .targets.python import PythonTarget
 
 
 @click.group()
@@ -53,13 +54,15 @@ def ast(input, debug):
 @main.command(name='compile-python')
 @click.argument('input', type=click.Path('r'))
 @click.option('--debug', '-g', is_flag=True)
-def compilePython(input, debug):
+@click.option('--engine', type=click.Choice(['auto'] + list(ENGINES)), default='auto', help='Default execution engine of the generated script')
+@click.option('--mode', type=click.Choice(list(PythonTarget.MODES)), default='ir', help='ir rebuilds the machine and runs it with amc, flat expands the reachable m-function instances into a standalone script, closure makes each m-function a python function building its instances on demand in a standalone script')
+@click.option('--max-states', type=int, default=100000, help='Maximum number of states expanded by the flat mode')
+def compilePython(input, debug, engine, mode, max_states):
   path = Path(input).resolve()
   try :
     with open(path, 'r') as f :
       m = buildIR(f, path)
-    from .targets.python import PythonTarget
-    t = PythonTarget()
+    t = PythonTarget(engine, mode, max_states)
     t.dump(m, sys.stdout, path.with_suffix('.py').name)
   except :
     if debug :
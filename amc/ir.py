@@ -5,29 +5,39 @@ L'interpréteur python utilise cette ir, et la transpilation vers python ne fait
 avant d'appeler le runtime
 """
 
+import typing as th
+import weakref
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import NamedTuple
+
 from .parsing.ast import *
 
 
 class IRNode(object):
   """
-  Un noeud de la représentation intermédiaire (Stocke la traduction de context vers les noeuds fils)
+  Un noeud de la représentation intermédiaire. Le contexte est le tuple des valeurs des arguments
+  de la m-fonction englobante (suivi du symbole lu pour la règle par défaut), les noms étant
+  résolus en indices à la construction de l'IR
   """
-  def bind(self, ctx:'Context') -> 'IRNode':
+  __slots__ = ()
+  def instanciate(self, ctx:'Context'=()) -> 'FinalIRNode':
     raise NotImplementedError()
 
-  def instanciate(self, ctx:'Context'={}) -> 'FinalIRNode':
-    raise NotImplementedError()
+  def uses_slot(self, slot:int) -> bool:
+    """
+    Indique si l'instanciation de ce noeud lit l'indice `slot` du contexte
+    """
+    return False
 
-Context = dict[str, IRNode]
+Context = tuple['IRNode|str', ...]
 
 class FinalIRNode(IRNode):
   """
   Marqueur pour dire qu'un IRNode n'est pas dynamique
   """
-  def bind(self, ctx:Context) -> IRNode:
-    return self
-
-  def instanciate(self, ctx:Context={}) -> 'FinalIRNode':
+  __slots__ = ()
+  def instanciate(self, ctx:Context=()) -> 'FinalIRNode':
     return self
     
 
@@ -36,36 +46,16 @@ class Dyn(object):
   """
   Un noeud dynamique
   """
-  class Bound(IRNode):
-    """
-    
-    """
-    def __init__(self, target:'Dyn', ctx:Context):
-      self.target = target
-      self.ctx = ctx
-
-    def bind(self, ctx):
-      ctx = {**self.ctx, **ctx}
-      return self.__class__(self.target, ctx)
-
-    def instanciate(self, ctx:Context={}):
-      ctx = {**self.ctx, **ctx}
-      return self.target.instanciate(ctx)
-      
-      
-  def __init__(self):
-    self.ctx = {}
-
-  def bind(self, ctx:dict[str, IRNode]):
-    return self.Bound(self, ctx)
+  __slots__ = ()
 
 class Action(IRNode):
   """
   Action sur la bande
   """
-  pass
+  __slots__ = ()
 
 class FinalAction(FinalIRNode, Action):
+  __slots__ = ()
   def __repr__(self):
     if self is Action.LEFT :
       return '<Action <- >'
@@ -77,38 +67,66 @@ Action.RIGHT = FinalAction()
 
 class ActionPrint(FinalAction):
   """
-  Écriture sur la bande
+  Écriture sur la bande. Les instances sont partagées : une seule par symbole (voir ActionPrint.cache)
   """
-  def __init__(self, symbol:str):
-    self.symbol = symbol
+  __slots__ = ('symbol',)
+  cache = {} # type: dict[str, ActionPrint]
+
+  def __new__(cls, symbol:str):
+    rv = cls.cache.get(symbol)
+    if rv is None :
+      rv = cls.cache[symbol] = super().__new__(cls)
+      rv.symbol = symbol
+    return rv
 
   def __repr__(self):
     return f'<Action P:{self.symbol}>'
 
 class DynPrint(Dyn, Action):
   """
-  Un print avec un symbol synamique
+  Un print avec un symbol synamique (lu dans le contexte à l'indice `slot`)
   """
-  def __init__(self, dyn_symbol:str):
-    super().__init__()
+  __slots__ = ('dyn_symbol', 'slot')
+  def __init__(self, dyn_symbol:str, slot:int):
     self.dyn_symbol = dyn_symbol
+    self.slot = slot
+
+  def instanciate(self, ctx:Context):
+    return ActionPrint(ctx[self.slot])
+
+  def uses_slot(self, slot:int) -> bool:
+    return self.slot == slot
+
+class SymbolPlaceholder(Dyn, IRNode):
+  """
+  Un argument symbole générique passé à une m-fonction (lu dans le contexte à l'indice `slot`)
+  """
+  __slots__ = ('ph_name', 'slot')
+  def __init__(self, ph_name:str, slot:int):
+    self.ph_name = ph_name
+    self.slot = slot
 
   def instanciate(self, ctx:Context):
-    return ActionPrint(ctx[self.dyn_symbol])
+    return ctx[self.slot]
+
+  def uses_slot(self, slot:int) -> bool:
+    return self.slot == slot
+
+  @property
+  def name(self):
+    return self.ph_name
 
 class StateReference(Dyn, IRNode):
   """
-  Référence vers un état (stocke aussi la traduction de context)
+  Référence vers un état
   """
-  class Bound(Dyn.Bound):
-    @property
-    def name(self):
-      return self.target.name
+  __slots__ = ()
 
 class Rule(FinalIRNode):
   """
   Un règle
   """
+  __slots__ = ('actions', '_finalState')
   def __init__(self, actions:list[FinalAction], finalState:StateReference):
     self.actions = actions
     self._finalState = finalState
@@ -117,31 +135,61 @@ class Rule(FinalIRNode):
   def finalState(self):
     return self._finalState.instanciate()
 
+PRINT_SHIFT = 64 # Les actions sont comptées exactement jusqu'à 2**64 (plus de 10**19)
+
+class Transition(NamedTuple):
+  """
+  Une règle résolue pour un état concret et un symbole lu : les actions et l'état suivant
+  sont définitifs. `ops` reprend `actions` avec les symboles écrits remplacés par leur code
+  (voir Alphabet), Action.LEFT et Action.RIGHT restant tels quels. `sweep` vaut -1 ou 1 si la
+  transition est un balayage (un seul déplacement, sans écriture, vers le même état), 0 sinon.
+  Si la transition a plusieurs actions (`fused`), elles sont aussi résumées en un programme :
+  `writes` (décalage par rapport à la tête, code) pour la dernière écriture de chaque case,
+  `delta` le déplacement total de la tête, et [lo, hi] les décalages atteints.
+  `counts` compte les actions et, décalées de PRINT_SHIFT bits, les écritures : les boucles
+  d'exécution les cumulent en une seule addition (voir Interpreter.counts)
+  """
+  actions: tuple[FinalAction]
+  state: 'State'
+  ops: tuple[FinalAction|int]
+  sweep: int = 0
+  fused: bool = False
+  writes: tuple[tuple[int, int], ...] = ()
+  delta: int = 0
+  lo: int = 0
+  hi: int = 0
+  counts: int = 0
+
 class DynRule(Dyn, IRNode):
   """
-  
+  Une règle de la machine, instanciée avec le contexte de son état. Les règles structurellement
+  identiques sont partagées (voir IRBuilder.intern)
   """
-  def __init__(self, actions:list[FinalAction], finalState:StateReference):
+  __slots__ = ('actions', 'finalState')
+  def __init__(self, actions:tuple[Action, ...], finalState:StateReference):
     self.actions = actions
     self.finalState = finalState
 
-  def instanciate(self, ctx:Context={}) -> FinalIRNode:
-    return Rule([ a.instanciate(ctx) for a in self.actions ], self.finalState.bind(ctx))
+  def instanciate(self, ctx:Context=()) -> FinalIRNode:
+    return Rule([ a.instanciate(ctx) for a in self.actions ], self.finalState.instanciate(ctx))
+
+  def uses_slot(self, slot:int) -> bool:
+    return any( a.uses_slot(slot) for a in self.actions ) or self.finalState.uses_slot(slot)
 
 class StatePlaceholder(StateReference):
   """
-  Un placeholder pour un état
+  Un placeholder pour un état (lu dans le contexte à l'indice `slot`)
   """
-  def __init__(self, ph_name:str):
+  __slots__ = ('ph_name', 'slot')
+  def __init__(self, ph_name:str, slot:int):
     self.ph_name = ph_name
+    self.slot = slot
 
   def instanciate(self, ctx:Context):
-    rv = ctx.get(self.ph_name, None)
-    if rv is None :
-      raise RuntimeError('Oops, placeholder not in context. Should have been caught at ir building time')
-    while isinstance(rv, (Dyn.Bound, StateReference)) :
-      rv = rv.instanciate()
-    return rv
+    return ctx[self.slot]
+
+  def uses_slot(self, slot:int) -> bool:
+    return self.slot == slot
 
   @property
   def name(self):
@@ -149,24 +197,20 @@ class StatePlaceholder(StateReference):
 
 
 class StaticStateReference(StateReference):
-    
-  def __init__(self, state:'State', args:tuple[StateReference|str]):
+  __slots__ = ('state', 'args')
+
+  def __init__(self, state:'State', args:tuple[StateReference|SymbolPlaceholder|str]):
     self.state = state
     self.args = args
 
-  def instanciate(self, ctx:Context={}):
-    return self.state.instanciate({
-      name: (
-        (
-          ctx[a]
-          if is_generic(a) else
-          a
-        )
-        if isinstance(a, str) else
-        a.bind(ctx)
-      )
-      for name, a in zip(self.state.args, self.args)
-    })
+  def instanciate(self, ctx:Context=()):
+    return self.state.instanciate(tuple(
+      a if isinstance(a, str) else a.instanciate(ctx)
+      for a in self.args
+    ))
+
+  def uses_slot(self, slot:int) -> bool:
+    return any( not isinstance(a, str) and a.uses_slot(slot) for a in self.args )
 
   @property
   def name(self):
@@ -179,12 +223,7 @@ class State(Dyn, IRNode):
   """
   État de la machine de turing ou mfunction selon si args est None ou pas
   """
-  class Bound(Dyn.Bound):
-    @property
-    def name(self):
-      name_args = ', '.join(f'{a}={getname(self.ctx[a])}' for a in self.target.args)
-      return f'{self.target.name}({name_args})'
-
+  __slots__ = ('name', 'args', 'rules', 'default_symbol_name', 'default_rule', 'transitions', '_sweeps', '_heads', '__weakref__')
   def __init__(self, name:str, args:tuple[str], rules:dict[str, DynRule], default_symbol_name:str=None, default_rule:DynRule=None):
     self.name = name
     if args is None :
@@ -193,45 +232,275 @@ class State(Dyn, IRNode):
     self.rules = rules
     self.default_symbol_name = default_symbol_name
     self.default_rule = default_rule
+    self.transitions = {} # type: dict[int, Transition]
+    self._sweeps = None # type: dict[int, bytes|None]
+    self._heads = None
     
-  def instanciate(self, ctx:Context={}) -> FinalIRNode:
+  def instanciate(self, ctx:Context=()) -> FinalIRNode:
+    """
+    Instancie la m-fonction avec `ctx`, le tuple des valeurs de ses arguments. Les arguments de
+    type état doivent déjà être instanciés : une instance est ainsi identifiée par
+    (m-fonction, arguments) et n'est créée qu'une fois tant qu'elle est vivante (voir InstanceCache)
+    """
     if not len(self.args) :
       return self
-    scope = { a: ctx[a] for a in self.args }
-    name_args = ', '.join(f'{a}={getname(ctx[a])}' for a in self.args)
-    return State(
-      f'{self.name}({name_args})',
-      tuple(),
-      { scope.get(s, s): r.bind(scope) for s, r in self.rules.items() },
-      self.default_symbol_name,
-      self.default_rule.bind(scope) if self.default_rule is not None else None
-    )
+    key = (self, ctx)
+    rv = State.instances.get(key)
+    if rv is None :
+      rv = StateInstance(self, key[1])
+      State.instances.add(key, rv)
+    return rv
+
+  def symbol_heads(self, values:tuple) -> dict[str, str|None]:
+    """
+    Table de traduction symbole lu -> tête de règle pour les règles dont la tête est un argument
+    symbole, avec `values` comme valeurs des arguments. Une règle définie plus loin l'emporte
+    sur les précédentes, et les noms d'arguments eux-même sont masqués (None)
+    """
+    if self._heads is None :
+      pos = { s: i for i, s in enumerate(self.rules) }
+      self._heads = pos, [ (s, self.args.index(s), pos[s]) for s in self.rules if s in self.args ]
+    pos, heads = self._heads
+    if not heads :
+      return State.NO_HEADS
+    rv = {}
+    won = {}
+    for s, i, p in heads :
+      v = values[i]
+      if pos.get(v, -1) > p or won.get(v, -1) > p :
+        continue
+      rv[v] = s
+      won[v] = p
+    for s, i, p in heads :
+      rv.setdefault(s, None)
+    return rv
 
   def instanciate_rule(self, symbol) -> Rule:
     r = self.rules.get(symbol)
     if r is None :
-      if self.default_rule is None :
-        return Rule([], State.REJECT)
-      symb = self.default_symbol_name
-      if symb is None :
-        symb = '...'
-      return self.default_rule.instanciate({symb: symbol})
+      return self.instanciate_default(symbol)
     else :
       return r.instanciate()
+
+  def instanciate_default(self, symbol) -> Rule:
+    if self.default_rule is None :
+      return Rule([], State.REJECT)
+    return self.default_rule.instanciate((symbol,))
+
+  def explicit_symbols(self) -> th.Iterable[str]:
+    """
+    Symboles lus ayant une règle propre, les autres relevant de la règle par défaut
+    """
+    return self.rules
+
+  def sweep_stops(self, direction:int, alphabet:'Alphabet') -> bytes|None:
+    """
+    Codes des symboles qui interrompent un balayage de cet état (concret) dans la direction
+    `direction`, c'est-à-dire dont la transition n'est pas un balayage dans ce sens. None si
+    ces symboles ne se réduisent pas à quelques règles explicites (MAX_SWEEP_STOPS au plus)
+    """
+    if self._sweeps is None :
+      self._sweeps = {}
+    rv = self._sweeps.get(direction, False)
+    if rv is not False :
+      return rv
+    rv = None
+    template = self.template if isinstance(self, StateInstance) else self
+    default_rule = template.default_rule
+    if default_rule is not None and not default_rule.uses_slot(len(template.args)) :
+      r = self.instanciate_default(None)
+      if r.finalState is self and r.actions == [ Action.RIGHT if direction > 0 else Action.LEFT ] :
+        codes = { alphabet.encode(s) for s in self.explicit_symbols() }
+        stops = bytes(sorted( c for c in codes if self.transition(c, alphabet).sweep != direction ))
+        if len(stops) <= State.MAX_SWEEP_STOPS :
+          rv = stops
+    self._sweeps[direction] = rv
+    return rv
+
+  def transition(self, code:int, alphabet:'Alphabet') -> Transition:
+    """
+    Retourne la transition de cet état (concret) pour le symbole de code `code`. Elle n'est
+    résolue qu'une fois, puis servie depuis self.transitions
+    """
+    rv = self.transitions.get(code)
+    if rv is None :
+      State.resolved += 1
+      r = self.instanciate_rule(alphabet.symbols[code])
+      actions = tuple(r.actions)
+      state = r.finalState
+      sweep = 0
+      if state is self and len(actions) == 1 :
+        sweep = 1 if actions[0] is Action.RIGHT else -1 if actions[0] is Action.LEFT else 0
+      ops = tuple( alphabet.encode(a.symbol) if isinstance(a, ActionPrint) else a for a in actions )
+      writes = {}
+      delta = lo = hi = 0
+      for a in ops :
+        if a is Action.LEFT :
+          delta -= 1
+          lo = min(lo, delta)
+        elif a is Action.RIGHT :
+          delta += 1
+          hi = max(hi, delta)
+        else :
+          writes.pop(delta, None)
+          writes[delta] = a
+      rv = self.transitions[code] = Transition(actions, state, ops, sweep, len(ops) > 1, tuple(writes.items()), delta, lo, hi, len(ops) + (sum( 1 for a in actions if isinstance(a, ActionPrint) ) << PRINT_SHIFT))
+    return rv
         
   def __repr__(self):
     return f'<State "{self.name}">'
     
+class StateInstance(State):
+  """
+  Instance d'une m-fonction : une simple vue (m-fonction, valeurs des arguments). Les règles
+  sont résolues à la demande sur celles de la m-fonction, sans copie.
+  """
+  __slots__ = ('template', 'values', 'heads', '_name')
+  def __init__(self, template:State, values:tuple):
+    self.template = template
+    self.values = values
+    self.args = tuple()
+    self.heads = template.symbol_heads(values)
+    self.transitions = {} # type: dict[int, Transition]
+    self._sweeps = None # type: dict[int, bytes|None]
+    self._name = None
+
+  @property
+  def name(self):
+    if self._name is None :
+      self._name = self.describe(State.NAME_LENGTH)
+    return self._name
+
+  def describe(self, budget:int) -> str:
+    """
+    Nom de l'instance, d'environ `budget` caractères au plus : les instances imbriquées et les
+    arguments qui ne tiennent plus sont abrégés en `m-fonction(…)` et `…`. La taille du nom (et la profondeur de récursion)
+    reste ainsi bornée, même pour des imbrications profondes ou des arguments partagés
+    """
+    if self._name is not None and len(self._name) <= budget :
+      return self._name
+    t = self.template
+    budget -= len(t.name) + 2
+    if budget <= 0 :
+      return f'{t.name}(…)'
+    name_args = []
+    for a, v in zip(t.args, self.values) :
+      if budget <= 0 :
+        name_args.append('…')
+        break
+      arg = f'{a}={v.describe(budget - len(a) - 1) if isinstance(v, StateInstance) else getname(v)}'
+      budget -= len(arg) + 2
+      name_args.append(arg)
+    return f'{t.name}({", ".join(name_args)})'
+
+  def instanciate(self, ctx:Context=()) -> FinalIRNode:
+    return self
+
+  def instanciate_rule(self, symbol) -> Rule:
+    t = self.template
+    head = self.heads.get(symbol, symbol)
+    r = t.rules.get(head) if head is not None else None
+    if r is None :
+      return self.instanciate_default(symbol)
+    else :
+      return r.instanciate(self.values)
+
+  def instanciate_default(self, symbol) -> Rule:
+    if self.template.default_rule is None :
+      return Rule([], State.REJECT)
+    return self.template.default_rule.instanciate(self.values + (symbol,))
+
+  def explicit_symbols(self) -> th.Iterable[str]:
+    heads = self.heads
+    return [ s for s in self.template.rules if s not in heads ] + [ v for v, s in heads.items() if s is not None ]
+
+
+class InstanceCache(object):
+  """
+  Cache des instances de m-fonctions, indexé par (m-fonction, arguments).
+  Les `maxsize` instances les plus récemment utilisées sont gardées (LRU), les autres ne sont
+  conservées que tant qu'elles sont référencées ailleurs (références faibles). Il n'existe donc
+  jamais deux instances vivantes identiques, et la mémoire reste bornée si le nombre d'instances
+  ne l'est pas. Une instance qui sort du LRU oublie ses transitions résolues, qui référencent les
+  états suivants : sans cela, les chaînes d'instances partant des états simples de la machine
+  resteraient toutes vivantes.
+  """
+  def __init__(self, maxsize:int=4096):
+    self.maxsize = maxsize
+    self.recent = OrderedDict() # type: OrderedDict[tuple, State]
+    self.alive = weakref.WeakValueDictionary() # type: weakref.WeakValueDictionary[tuple, State]
+    self.created = 0
+
+  def get(self, key:tuple) -> 'State|None':
+    rv = self.recent.get(key)
+    if rv is not None :
+      self.recent.move_to_end(key)
+      return rv
+    rv = self.alive.get(key)
+    if rv is not None :
+      self.keep(key, rv)
+    return rv
+
+  def add(self, key:tuple, state:'State'):
+    self.created += 1
+    self.alive[key] = state
+    self.keep(key, state)
+
+  def keep(self, key:tuple, state:'State'):
+    recent = self.recent
+    recent[key] = state
+    if len(recent) > self.maxsize :
+      recent.popitem(last=False)[1].transitions.clear()
+
+  def clear(self):
+    self.recent.clear()
+    self.alive.clear()
+
+  def __len__(self):
+    return len(self.alive)
+
+State.instances = InstanceCache()
+State.resolved = 0 # Nombre de transitions résolues (voir State.transition)
+State.MAX_SWEEP_STOPS = 8
+State.NAME_LENGTH = 1000 # Taille au-delà de laquelle les noms d'instances sont abrégés (voir StateInstance.describe)
+State.NO_HEADS = MappingProxyType({})
+
 State.ACCEPT = State('ACCEPT()', None, {}, None, None )
 State.REJECT = State('REJECT()', None, {}, None, None )
     
-def getname(a:str|State|State.Bound):
+def getname(a:str|State|StateReference|SymbolPlaceholder):
   if isinstance(a, str) :
     return a
   return a.name
 
 
 
+class Alphabet(object):
+  """
+  Codage des symboles de bande en petits entiers : 0 est le symbole vide, les autres sont
+  numérotés dans leur ordre d'ajout. Les symboles inconnus (lus sur le ruban initial) sont
+  ajoutés à la volée.
+  """
+  def __init__(self, symbols:th.Iterable[str]=()):
+    self.symbols = [''] # type: list[str]
+    self.codes = {'': 0} # type: dict[str, int]
+    for s in symbols :
+      self.encode(s)
+
+  def encode(self, symbol:str) -> int:
+    rv = self.codes.get(symbol)
+    if rv is None :
+      rv = self.codes[symbol] = len(self.symbols)
+      self.symbols.append(symbol)
+    return rv
+
+  def decode(self, code:int) -> str:
+    return self.symbols[code]
+
+  def __len__(self):
+    return len(self.symbols)
+
+
 class AMachine(object):
   """
   Machine de turing
@@ -240,6 +509,7 @@ class AMachine(object):
     self.symbols = symbols
     self.states = states
     self.init_state = init_state
+    self.alphabet = Alphabet(symbols)
 
 
 
@@ -102,12 +102,24 @@ class IRBuilder(object):
     self.referenced_states = defaultdict(lambda: set()) # type: defaultdict[str, set[tuple[int]]] # Utilisé pour supprimer les états non accessibles
     self.init_ref = None # type: ASTAbstractStateReference
     self.init_state = None
+    self.node_cache = {} # type: dict[tuple, IRNode]
     
     self.include_pass(ast)
     self.decl_pass()
     self.link_pass()
     return self.create_machine()
 
+  def intern(self, cls:type, *args) -> IRNode:
+    """
+    Retourne le noeud `cls(*args)`, partagé avec tous les noeuds structurellement identiques
+    (les arguments doivent eux-même être partagés)
+    """
+    key = (cls,) + args
+    rv = self.node_cache.get(key)
+    if rv is None :
+      rv = self.node_cache[key] = cls(*args)
+    return rv
+
   def reference(self, decl):
     self.referenced_states[decl.name].add(decl.signature)
 
@@ -196,7 +208,7 @@ class IRBuilder(object):
         raise NoInitialState()
       init_decl = self.states[-1]
       init_state, _ = self.state_cache[init_decl.name][init_decl.signature]
-      self.init_state = StaticStateReference(init_state, tuple())
+      self.init_state = self.intern(StaticStateReference, init_state, ())
     self.visitState(self.init_state.state, init_decl)
 
   def visitState(self, state:State, decl:ASTStateDecl|ASTMFunctionDecl):
@@ -208,26 +220,29 @@ class IRBuilder(object):
     for r in decl.rules : # type: ASTAbstractRule
       self.visitRule(state, r)
 
-  def resolveState(self, ref:ASTAbstractStateReference, ctx=set()) -> tuple[StateReference, ASTNode|None]:
+  def resolveState(self, ref:ASTAbstractStateReference, ctx:dict[str, int]={}) -> tuple[StateReference, ASTNode|None]:
+    """
+    `ctx` associe à chaque nom d'argument accessible son indice dans le contexte (voir ir.Context)
+    """
     if ref.name == 'STOP' :
       try :
         if len(ref.args) == 1 :
           if ref.args[0].name == 'ACCEPT' :
-            return StaticStateReference(State.ACCEPT, tuple()), None
+            return self.intern(StaticStateReference, State.ACCEPT, ()), None
           elif ref.args[0].name == 'REJECT' :
-            return StaticStateReference(State.REJECT, tuple()), None
+            return self.intern(StaticStateReference, State.REJECT, ()), None
       except :
         pass
       raise UnknownStopArgument(repr(ref.args))
     if isinstance(ref, ASTStateReference) and ref.name in ctx :
-      return StatePlaceholder(ref.name), None
+      return self.intern(StatePlaceholder, ref.name, ctx[ref.name]), None
     try :
       state, decl = self.state_cache[ref.name][ref.signature]
     except :
       raise stateNotDefined(ref)
     if isinstance(ref, ASTStateReference) :
       self.visitState(state, decl)
-      return StaticStateReference(state, tuple()), decl
+      return self.intern(StaticStateReference, state, ()), decl
     elif isinstance(ref, ASTMFunctionReference) :
       args = []
       for a in ref.args :
@@ -237,14 +252,15 @@ class IRBuilder(object):
         elif isinstance(a, ASTAbstractSymbol) :
           if not a.is_generic :
             self.symbol_cache.add(a.name)
+            args.append(a.name)
           else :
             if a.name not in ctx :
               raise GenericSymbolNotDefined(a)
-          args.append(a.name)
+            args.append(self.intern(SymbolPlaceholder, a.name, ctx[a.name]))
         else :
           raise UnknownArgumentType(a)
       self.visitState(state, decl)
-      return StaticStateReference(state, tuple(args)), decl
+      return self.intern(StaticStateReference, state, tuple(args)), decl
     else :
       raise UnknownStateReferenceType(ref)
 
@@ -256,33 +272,37 @@ class IRBuilder(object):
     if symb.is_generic and symb.name not in state.args:
       if state.default_rule is not None :
         raise MultipleDefaultRules(state)
-      ctx = set(state.args)
-      ctx.add(symb.name)
+      ctx = { a: i for i, a in enumerate(state.args) }
+      ctx[symb.name] = len(state.args)
       final_state, final_state_decl = self.resolveState(rule_decl.final_state, ctx)
-      actions = [ self.visitAction(a) for a in rule_decl.actions ]
-      state.default_rule = DynRule(actions, final_state)
+      actions = tuple( self.visitAction(a, ctx) for a in rule_decl.actions )
+      state.default_rule = self.intern(DynRule, actions, final_state)
       state.default_symbol_name = name
       if not isinstance(final_state, StatePlaceholder) :
         self.visitState(final_state.state, final_state_decl)
       return
     if name :
       self.symbol_cache.add(name)
-    ctx = set(state.args)
+    ctx = { a: i for i, a in enumerate(state.args) }
     final_state, final_state_decl = self.resolveState(rule_decl.final_state, ctx)
-    actions = [ self.visitAction(a) for a in rule_decl.actions ]
-    state.rules[name] = DynRule(actions, final_state)
+    actions = tuple( self.visitAction(a, ctx) for a in rule_decl.actions )
+    state.rules[name] = self.intern(DynRule, actions, final_state)
     if not isinstance(final_state, StatePlaceholder) :
       self.visitState(final_state.state, final_state_decl)
 
-  def visitAction(self, act:ASTAbstractAction):
+  def visitAction(self, act:ASTAbstractAction, ctx:dict[str, int]):
     if isinstance(act, ASTActionLeft) :
       return Action.LEFT
     elif isinstance(act, ASTActionRight) :
       return Action.RIGHT
     elif isinstance(act, ASTActionPrint) :
       if act.symbol.is_generic :
-        return DynPrint(act.symbol.name)
+        if act.symbol.name not in ctx :
+          raise GenericSymbolNotDefined(act.symbol)
+        return self.intern(DynPrint, act.symbol.name, ctx[act.symbol.name])
       else :
+        if act.symbol.name :
+          self.symbol_cache.add(act.symbol.name)
         return ActionPrint(act.symbol.name)
     else :
       raise UnknownActionType()
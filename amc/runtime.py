@@ -1,12 +1,87 @@
 import click
+import copy
+import json
+import signal
+import sys
+import threading
+import time
+import typing as th
+from array import array
+from enum import IntFlag
+from collections import deque
 from functools import reduce
+from typing import NamedTuple
 
 from .ir import *
+from .tape import BaseTape, Tape, ChunkedTape, TAPE_BACKENDS
 
 class StopMachine(Exception):
   pass
 
 
+class Event(IntFlag):
+  """
+  Types d'événements auxquels un Observer peut s'abonner
+  """
+  PRINT = 1
+  MOVE = 2
+  STATE = 4
+  ACCEPT = 8
+  REJECT = 16
+  ACTION = PRINT | MOVE
+  HALT = ACCEPT | REJECT
+  ALL = ACTION | STATE | HALT
+
+
+class Observer(object):
+  """
+  Abonnement aux événements d'un Interpreter.
+  Les événements sont des tuples (event, step, head, data), où data est le symbole écrit (PRINT),
+  le déplacement -1/1 (MOVE), le nouvel état (STATE) ou le dernier état avant l'arrêt (ACCEPT/REJECT).
+  `callback` reçoit des listes d'au plus `batch` événements. Si `every` > 1, seul un événement
+  sur `every` est transmis.
+  """
+  def __init__(self, callback:th.Callable[[list[tuple]], None], mask:Event=Event.ALL, batch:int=1, every:int=1):
+    self.callback = callback
+    self.mask = mask
+    self.batch = batch
+    self.every = every
+    self.skipped = 0
+    self.events = []
+
+  def push(self, event:tuple):
+    if self.every > 1 :
+      self.skipped += 1
+      if self.skipped < self.every :
+        return
+      self.skipped = 0
+    self.events.append(event)
+    if len(self.events) >= self.batch :
+      self.flush()
+
+  def flush(self):
+    if self.events :
+      events = self.events
+      self.events = []
+      self.callback(events)
+
+
+def prime_factors(n:int) -> list[int]:
+  """
+  Facteurs premiers de `n`, avec leur multiplicité
+  """
+  rv = []
+  d = 2
+  while d * d <= n :
+    while n % d == 0 :
+      rv.append(d)
+      n //= d
+    d += 1
+  if n > 1 :
+    rv.append(n)
+  return rv
+
+
 class Interpreter(object):
   """
   Interpreteur de machine de turing
@@ -14,93 +89,999 @@ class Interpreter(object):
   ACCEPT = 1
   REJECT = 0
   STOPPED = -1
-  def __init__(self, machine: AMachine, tape:list[str], initpos=0):
+  LOOPING = -2
+  SUSPENDED = -3
+  BREAK = -4
+  CYCLE_CHUNK = 1024
+  RUN_BATCH = 1 << 16
+  EVENTS = Event.ALL # Événements (et callbacks) que le moteur sait signaler, voir select_engine
+  AUTO = True # Le moteur peut être choisi par select_engine('auto')
+  OPTIONS = () # Options de construction propres au moteur, voir create_interpreter
+  def __init__(self, machine: AMachine, tape:list[str]|BaseTape, initpos=0, tape_backend:str='buffer'):
+    """
+    `tape` est soit une liste de symboles, soit un ruban déjà construit. Dans le premier cas,
+    `tape_backend` donne la représentation du ruban (voir tape.TAPE_BACKENDS)
+    """
     self.head = initpos
+    self.machine = machine
+    self.alphabet = machine.alphabet
+    if not isinstance(tape, BaseTape) :
+      tape = TAPE_BACKENDS[tape_backend](self.alphabet.encode(s) for s in tape)
+    if len(self.alphabet) > 0x100 :
+      tape.widen()
     self.tape = tape
     self.previous_state = None
     self.state = machine.init_state.instanciate()
+    self.steps = 0
+    self.counts = 0 # Actions et écritures effectuées, voir actions et prints
     self.print_cb = None
     self.action_cb = None
     self.state_cb = None
+    self.observers = [] # type: list[Observer]
+    self._observing = { e: [] for e in Event.__members__.values() } # type: dict[Event, list[Observer]]
     self.cur_act = None
     self.keep_unused_tape = False
+    self.detect_cycles = False
+    self.cycle_length = None
+    self.cycle_start = None
+    self._checkpointer = None
+    self._brent = None
+    self.breaks = None # type: dict[State, frozenset[int]]
+    self.break_states = {} # type: dict[str, frozenset[int]]
+    self.break_step = None
+    self.break_tape_len = None
+    self._break = False
+    self._break_skip = None
     if self.head < 0 :
-      self.tape[:0] = [''] * (-self.head)
+      self.tape.grow_left(-self.head)
       self.head = 0
     if len(self.tape) <= self.head :
-      self.tape[len(self.tape):] = [''] * (self.head - len(self.tape) + 1)
-      
+      self.tape.grow_right(self.head - len(self.tape) + 1)
+
+  def observe(self, callback:th.Callable[[list[tuple]], None], mask:Event=Event.ALL, batch:int=1, every:int=1) -> Observer:
+    """
+    Abonne `callback` aux événements de `mask` (voir Observer)
+    """
+    rv = Observer(callback, mask, batch, every)
+    self.observers.append(rv)
+    return rv
+
+  def unobserve(self, observer:Observer):
+    observer.flush()
+    self.observers.remove(observer)
+
+  def notify(self, event:Event, data):
+    for o in self._observing[event] :
+      o.push((event, self.steps, self.head, data))
 
   def read_tape(self):
     if self.head < 0 or self.head >= len(self.tape) :
       return None
-    return self.tape[self.head]
+    return self.alphabet.symbols[self.tape[self.head]]
 
   def write_tape(self, symbol:str):
-    self.tape[self.head] = symbol
+    self.tape[self.head] = self.alphabet.encode(symbol)
+
+  def symbols(self) -> list[str]:
+    """
+    Contenu du ruban, décodé
+    """
+    return [ self.alphabet.symbols[c] for c in self.tape ]
+
+  def configuration(self) -> tuple[State, int, bytes]:
+    """
+    Configuration de la machine à une translation près : état, position de la tête dans la fenêtre
+    utilisée et contenu de celle-ci. Deux pas ayant la même configuration ont la même suite.
+    """
+    return (self.state, self.head, self.tape.tobytes())
+
+  def checkpoint(self, path:str):
+    """
+    Ajoute un point de reprise à `path`. Seules les pages du ruban modifiées depuis le précédent
+    point de reprise écrit dans le même fichier sont enregistrées (voir checkpoint.py)
+    """
+    from .checkpoint import Checkpointer
+    if self._checkpointer is None or self._checkpointer.path != path :
+      self._checkpointer = Checkpointer(path)
+    self._checkpointer.write(self)
+
+  def resume(self, path:str):
+    """
+    Restaure l'état, la tête, le ruban et les compteurs (pas, actions, écritures, étendue du ruban,
+    voir stats) du dernier point de reprise de `path`.
+    Les points de reprise suivants vers `path` le prolongent.
+    """
+    from .checkpoint import load
+    record, codes, self._checkpointer = load(path, self.machine)
+    self.tape = type(self.tape)(codes, record['wide'], origin=record['start'])
+    if len(self.alphabet) > 0x100 :
+      self.tape.widen()
+    self.head = record['head']
+    self.steps = record['steps']
+    self.state = record['state']
+    self.previous_state = record['previous_state']
+    self.counts = record['counts']
+    self.tape.low, self.tape.high, self.tape.peak = record['low'], record['high'], record['peak']
+    self._brent = None
+
+  def progress(self) -> dict:
+    """
+    Compteurs d'avancement : pas, étendue du ruban utilisé et position de la tête (positions
+    absolues), état (ou m-fonction) courant, instances de m-fonctions vivantes et créées, transitions
+    résolues (ces deux derniers pour tout le processus)
+    """
+    state = self.state
+    return {
+      'steps': self.steps,
+      'start': self.tape.position(0),
+      'stop': self.tape.position(len(self.tape)),
+      'head': self.tape.position(self.head),
+      'state': state.template.name if isinstance(state, StateInstance) else state.name,
+      'instances': len(State.instances),
+      'created': State.instances.created,
+      'transitions': State.resolved,
+    }
+
+  def set_breakpoints(self, states:th.Iterable[tuple[str, str|None]]=(), step:int=None, tape_len:int=None):
+    """
+    Points d'arrêt : run() retourne BREAK avant d'exécuter un pas depuis un état de `states`
+    (couples (nom de l'état ou de la m-fonction, symbole lu ou None pour tous)), avant le pas `step`,
+    ou dès que le ruban utilisé dépasse `tape_len` cases. Les deux derniers ne servent qu'une fois.
+    Les points d'arrêt sur les états sont vérifiés dans les boucles rapides, par état, à l'aide
+    des codes précalculés dans self.breaks
+    """
+    every = frozenset(range(len(self.alphabet)))
+    codes = {} # type: dict[str, set[int]]
+    for name, symbol in states :
+      codes.setdefault(name, set()).update(every if symbol is None else (self.alphabet.encode(symbol),))
+    self.break_states = { name: frozenset(c) for name, c in codes.items() }
+    self.break_step = step
+    self.break_tape_len = tape_len
+    self.breaks = {} if self.break_states or tape_len is not None else None
+
+  def break_codes(self, state:State) -> frozenset[int]:
+    """
+    Codes des symboles sur lesquels l'exécution s'arrête dans `state` (mémorisés dans self.breaks)
+    """
+    rv = self.breaks[state] = self.break_states.get(state.template.name if isinstance(state, StateInstance) else state.name, frozenset())
+    return rv
+
+  def breaking(self, code:int, length:int) -> bool:
+    """
+    Vrai si un point d'arrêt arrête l'exécution avant le pas courant, qui lit `code` avec un ruban
+    utilisé de `length` cases (pour les boucles lentes)
+    """
+    hit = self.breaks.get(self.state)
+    if hit is None :
+      hit = self.break_codes(self.state)
+    if (code in hit or self.break_tape_len is not None and length > self.break_tape_len) and self.steps != self._break_skip :
+      self._break = True
+    return self._break
+
+  def break_hit(self) -> bool:
+    """
+    Après une exécution interrompue, vrai si c'est par un point d'arrêt. Les points d'arrêt sur le
+    pas et la taille du ruban sont alors désactivés s'ils ont servi, et celui de l'état courant
+    est ignoré au prochain pas
+    """
+    if self.break_step is not None and self.steps == self.break_step :
+      self.break_step = None
+      self._break = True
+    if not self._break :
+      return False
+    if self.break_tape_len is not None and len(self.tape) > self.break_tape_len :
+      self.break_tape_len = None
+      if not self.break_states :
+        self.breaks = None
+    self._break = False
+    self._break_skip = self.steps
+    return True
+
+  def fork(self) -> 'Interpreter':
+    """
+    Copie indépendante de l'interpréteur, qui poursuit l'exécution depuis le même point.
+    Le ruban est copié par BaseTape.fork : en O(1) avec tape_backend='chunked', dont les pages ne
+    sont copiées qu'à leur première écriture. Les callbacks sont conservés, mais pas les
+    observateurs ni le fichier de points de reprise.
+    """
+    rv = copy.copy(self)
+    rv.tape = self.tape.fork()
+    rv.observers = []
+    rv._observing = { e: [] for e in Event.__members__.values() }
+    rv._checkpointer = None
+    if self._brent is not None :
+      rv._brent = dict(self._brent)
+    return rv
 
   def perform_actions(self, actions:list[Action]):
+    observing = self._observing
     for a in actions :
       self.cur_act = a
       if a == Action.LEFT :
-        if not self.keep_unused_tape and self.head == len(self.tape) -1 and not self.tape[-1]:
-          del self.tape[-1]
-        self.head -= 1
-        if self.head < 0 :
-          self.tape[:0] = [''] * (-self.head)
-          self.head = 0
+        self.head = self.tape.move(self.head, -1, self.keep_unused_tape)
+        if observing[Event.MOVE] :
+          self.notify(Event.MOVE, -1)
       elif a == Action.RIGHT :
-        if not self.keep_unused_tape and self.head == 0 and not self.tape[0]:
-          del self.tape[0]
-        else :
-          self.head += 1
-        if len(self.tape) <= self.head :
-          self.tape[len(self.tape):] = [''] * (self.head - len(self.tape) + 1)
+        self.head = self.tape.move(self.head, 1, self.keep_unused_tape)
+        if observing[Event.MOVE] :
+          self.notify(Event.MOVE, 1)
       else :
         assert isinstance(a, ActionPrint)
         self.write_tape(a.symbol)
+        if observing[Event.PRINT] :
+          self.notify(Event.PRINT, a.symbol)
         if self.print_cb:
           self.print_cb(self)
       if self.action_cb:
         self.action_cb(self)
 
-  def execute(self):
+  @property
+  def actions(self) -> int:
+    """
+    Nombre d'actions effectuées (voir Transition.counts)
+    """
+    return self.counts & ((1 << PRINT_SHIFT) - 1)
+
+  @property
+  def prints(self) -> int:
+    """
+    Nombre d'écritures effectuées
+    """
+    return self.counts >> PRINT_SHIFT
+
+  def stats(self, status:int, elapsed:float=0., instances:int=0) -> 'RunStats':
+    """
+    Statistiques de l'interpréteur (voir RunStats), pour le résultat `status`
+    """
+    tape = self.tape
+    return RunStats(status, self.steps, self.actions, self.prints, tape.low, tape.high - 1, tape.peak, instances, elapsed)
+
+  def execute(self) -> 'RunStats':
+    """
+    Exécute la machine jusqu'à son arrêt (voir run) et retourne ses statistiques
+    """
+    created = State.instances.created
+    t0 = time.perf_counter()
+    status = self.run()
+    return self.stats(status, time.perf_counter() - t0, State.instances.created - created)
+
+  def run(self, max_steps:int=None, deadline:float=None, max_tape:int=None):
+    """
+    Exécute la machine jusqu'à son arrêt, ou jusqu'à ce qu'une limite soit atteinte : au plus
+    `max_steps` pas lors de cet appel, jusqu'à l'instant `deadline` (time.monotonic()), ou tant que
+    le ruban utilisé ne dépasse pas `max_tape` cases. La machine est alors suspendue (SUSPENDED) et
+    un nouvel appel la reprend. L'heure et la taille du ruban ne sont vérifiées que tous les
+    RUN_BATCH pas, ce qui ne coûte rien à la boucle d'exécution. Elle peut aussi être arrêtée par un
+    point d'arrêt (BREAK, voir set_breakpoints).
+    Sans callback ni observateur d'action, la boucle rapide (run_fast) est utilisée, par tranches
+    si des événements STATE sont observés
+    """
+    self._observing = { e: [ o for o in self.observers if o.mask & e ] for e in Event.__members__.values() }
     try:
-      self.previous_state = None
-      while True :
-        if self.state is State.ACCEPT:
-          return self.ACCEPT
-        elif self.state is State.REJECT :
-          return self.REJECT
-        r = self.state.instanciate_rule(self.read_tape())
-        self.perform_actions(r.actions)
-        self.previous_state = self.state
-        self.state = r.finalState.instanciate()
-        if self.state_cb :
-          self.state_cb(self)
+      if max_steps is None and deadline is None and max_tape is None :
+        if self.advance(self.break_step if self.break_step is not None and self.steps < self.break_step else None) :
+          return self.LOOPING
+        if self.state is not State.ACCEPT and self.state is not State.REJECT and self.break_hit() :
+          return self.BREAK
+      else :
+        end = None if max_steps is None else self.steps + max_steps
+        while self.state is not State.ACCEPT and self.state is not State.REJECT :
+          limit = self.steps + self.RUN_BATCH if end is None else min(self.steps + self.RUN_BATCH, end)
+          if self.break_step is not None and self.steps < self.break_step :
+            limit = min(limit, self.break_step)
+          if self.advance(limit) :
+            return self.LOOPING
+          if self.state is State.ACCEPT or self.state is State.REJECT :
+            break
+          if self.break_hit() :
+            return self.BREAK
+          if (
+            self.steps == end or
+            deadline is not None and time.monotonic() >= deadline or
+            max_tape is not None and len(self.tape) > max_tape
+          ) :
+            return self.SUSPENDED
+      if self.state is State.ACCEPT:
+        if self._observing[Event.ACCEPT] :
+          self.notify(Event.ACCEPT, self.previous_state)
+        return self.ACCEPT
+      else :
+        if self._observing[Event.REJECT] :
+          self.notify(Event.REJECT, self.previous_state)
+        return self.REJECT
     except StopMachine:
       return self.STOPPED
+    finally :
+      for o in self.observers :
+        o.flush()
+
+  def advance(self, limit:int=None) -> bool:
+    """
+    Exécute la machine jusqu'à son arrêt ou jusqu'au pas `limit`, par la boucle adaptée aux
+    callbacks et observateurs. Retourne True si la machine a été détectée comme bouclant
+    """
+    if self.print_cb or self.action_cb or self.state_cb or self._observing[Event.ACTION] :
+      loop = self.execute_observed
+    elif self._observing[Event.STATE] :
+      loop = self.execute_sampled
+    else :
+      loop = self.run_fast
+    if self.detect_cycles :
+      return self.execute_cycles(limit, loop)
+    loop(limit)
+    return False
+
+  def execute_observed(self, limit:int=None):
+    """
+    Boucle de référence, action par action
+    """
+    observing = self._observing[Event.STATE]
+    while self.state is not State.ACCEPT and self.state is not State.REJECT and self.steps != limit :
+      code = self.tape[self.head]
+      if self.breaks is not None and self.breaking(code, len(self.tape)) :
+        return
+      t = self.state.transitions.get(code)
+      if t is None :
+        t = self.state.transition(code, self.alphabet)
+      self.perform_actions(t.actions)
+      self.previous_state = self.state
+      self.state = t.state
+      self.steps += 1
+      self.counts += t.counts
+      if observing :
+        self.notify(Event.STATE, self.state)
+      if self.state_cb :
+        self.state_cb(self)
+
+  def execute_cycles(self, limit:int=None, loop:th.Callable[[int], None]=None) -> bool:
+    """
+    Exécution avec détection de cycle (algorithme de Brent) par `loop` (run_fast par défaut, ou la
+    boucle imposée par les callbacks et observateurs, voir advance) : la configuration est relevée
+    tous les `n` pas (n >= CYCLE_CHUNK et au moins deux fois la taille du ruban, ce qui rend le relevé
+    O(1) amorti) et comparée au dernier point de référence, renouvelé à chaque puissance de 2.
+    L'état de la détection est conservé dans self._brent d'un appel à l'autre.
+    Si la machine boucle, retourne True après avoir renseigné self.cycle_length (la période exacte)
+    et self.cycle_start (le pas d'entrée dans le cycle, voir cycle_entry)
+    """
+    if loop is None :
+      loop = self.run_fast
+    if self._brent is None :
+      self._brent = { 'power': 0, 'lam': 0, 'n': 0, 'saved': None, 'saved_step': 0, 'next': self.steps, 'origin': self.replica() }
+    b = self._brent
+    while True :
+      if b['lam'] == b['power'] :
+        b['n'] = max(self.CYCLE_CHUNK, 2 * len(self.tape))
+        b['saved'] = self.configuration()
+        b['saved_step'] = self.steps
+        b['next'] = self.steps + b['n']
+        b['power'] = 2 * b['power'] or 1
+        b['lam'] = 0
+      loop(b['next'] if limit is None else min(b['next'], limit))
+      if self.state is State.ACCEPT or self.state is State.REJECT or self.steps != b['next'] or self._break :
+        return False
+      b['lam'] += 1
+      b['next'] += b['n']
+      if len(self.tape) > b['n'] :
+        b['power'] = b['lam']
+        continue
+      if self.configuration() == b['saved'] :
+        break
+    saved = b['saved']
+    period = self.steps - b['saved_step']
+    for q in prime_factors(period) :
+      loop(self.steps + period // q)
+      if self.configuration() == saved :
+        period //= q
+      else :
+        loop(self.steps + period - period // q)
+    self.cycle_length = period
+    self.cycle_start = self.cycle_entry(b['origin'], period)
+    self._brent = None
+    return True
+
+  def replica(self) -> 'Interpreter':
+    """
+    Copie (fork) sans callback, point d'arrêt ni détection de cycle, pour rejouer l'exécution
+    """
+    rv = self.fork()
+    rv.print_cb = rv.action_cb = rv.state_cb = None
+    rv.detect_cycles = False
+    rv._brent = None
+    rv.set_breakpoints()
+    return rv
+
+  def cycle_entry(self, origin:'Interpreter', period:int) -> int:
+    """
+    Pas d'entrée dans le cycle de période `period` (seconde phase de Brent) : depuis `origin`, copie
+    prise au début de la détection, une tortue et un lièvre d'avance de `period` pas avancent par
+    tranches jusqu'à avoir la même configuration, puis l'entrée est cherchée par dichotomie dans la
+    dernière tranche. Coûte au plus deux fois les pas jusqu'à l'entrée
+    """
+    n = max(self.CYCLE_CHUNK, 2 * len(self.tape))
+    tortoise = origin.replica()
+    hare = origin.replica()
+    hare.run_fast(hare.steps + period)
+    if tortoise.configuration() == hare.configuration() :
+      return tortoise.steps
+    while True :
+      before = (tortoise.replica(), hare.replica())
+      tortoise.run_fast(tortoise.steps + n)
+      hare.run_fast(hare.steps + n)
+      if tortoise.configuration() == hare.configuration() :
+        break
+    # Configurations différentes à `lo` pas du début de la tranche, égales à `hi` pas
+    lo, hi = 0, n
+    while hi - lo > 1 :
+      mid = (lo + hi) // 2
+      t, h = before[0].replica(), before[1].replica()
+      t.run_fast(t.steps + mid - lo)
+      h.run_fast(h.steps + mid - lo)
+      if t.configuration() == h.configuration() :
+        hi = mid
+      else :
+        lo = mid
+        before = (t, h)
+    return before[0].steps + 1
+
+  def execute_sampled(self, limit:int=None):
+    """
+    Boucle rapide interrompue uniquement aux pas où un observateur attend un événement STATE
+    """
+    observing = self._observing[Event.STATE]
+    while self.state is not State.ACCEPT and self.state is not State.REJECT and self.steps != limit and not self._break :
+      delta = min( o.every - o.skipped for o in observing )
+      target = self.steps + delta if limit is None else min(self.steps + delta, limit)
+      done = self.steps
+      self.run_fast(target)
+      done = self.steps - done
+      if done == delta :
+        for o in observing :
+          o.skipped += delta - 1
+          o.push((Event.STATE, self.steps, self.head, self.state))
+      else :
+        for o in observing :
+          o.skipped += done
+
+  def run_fast(self, limit:int=None):
+    """
+    Exécute la machine sans callback jusqu'à son arrêt ou jusqu'au pas `limit`. Les rubans à
+    tampon (Tape et MmapTape) sont lus et écrits directement
+    """
+    if not isinstance(self.tape, Tape) :
+      return self.run_tape(limit)
+    tape = self.tape
+    cells = tape.cells
+    start = tape.start
+    stop = tape.stop
+    p = start + self.head
+    state = self.state
+    previous_state = self.previous_state
+    steps = self.steps
+    counts = self.counts
+    keep = self.keep_unused_tape
+    alphabet = self.alphabet
+    LEFT = Action.LEFT
+    RIGHT = Action.RIGHT
+    ACCEPT = State.ACCEPT
+    REJECT = State.REJECT
+    breaks = self.breaks
+    max_len = self.break_tape_len
+    skip = self._break_skip
+    if limit is None :
+      limit = -1
+    try :
+      while state is not ACCEPT and state is not REJECT and steps != limit :
+        code = cells[p]
+        if breaks is not None :
+          # Points d'arrêt : pas de balayage depuis un état en ayant
+          hit = breaks.get(state)
+          if hit is None :
+            hit = self.break_codes(state)
+          if (code in hit or max_len is not None and stop - start > max_len) and steps != skip :
+            self._break = True
+            break
+        t = state.transitions.get(code)
+        if t is None :
+          t = state.transition(code, alphabet)
+        sweep = t.sweep
+        if sweep and (p > start if sweep > 0 else p < stop - 1) and (breaks is None or not hit) :
+          # Balayage à l'intérieur de la fenêtre : aucun rognage ni extension possible
+          stops = state.sweep_stops(sweep, alphabet)
+          if stops is not None :
+            tape.start, tape.stop = start, stop
+            q = start + tape.scan(p - start, sweep, stops, limit - steps if limit >= 0 else stop - start)
+            if q != p :
+              steps += abs(q - p)
+              counts += abs(q - p)
+              p = q
+              previous_state = state
+              continue
+        if t.fused :
+          # Actions appliquées d'un bloc : sans rognage possible (trajet strictement intérieur
+          # à la fenêtre), ou en étendant la fenêtre une seule fois si le ruban est conservé
+          lo = p + t.lo
+          hi = p + t.hi
+          if keep and (lo < start or hi >= stop) :
+            if lo < 0 or hi >= len(cells) :
+              tape.start, tape.stop = start, stop
+              shift = tape.reserve(max(start - lo, 0), max(hi + 1 - stop, 0))
+              cells = tape.cells
+              start += shift
+              stop += shift
+              p += shift
+              lo += shift
+              hi += shift
+            if lo < start :
+              start = lo
+            if hi >= stop :
+              stop = hi + 1
+            tape.start, tape.stop = start, stop
+            tape.extended()
+          if keep or start < lo and hi < stop - 1 :
+            for o, c in t.writes :
+              cells[p + o] = c
+            p += t.delta
+            previous_state = state
+            state = t.state
+            steps += 1
+            counts += t.counts
+            continue
+        for a in t.ops :
+          if a is LEFT :
+            if not keep and p == stop - 1 and not cells[p] :
+              stop -= 1
+            p -= 1
+            if p < start :
+              if p < 0 :
+                tape.start, tape.stop = start, stop
+                shift = tape.reserve(1, 0)
+                cells = tape.cells
+                start += shift
+                stop += shift
+                p += shift
+              start = p
+              tape.start, tape.stop = start, stop
+              tape.extended()
+          elif a is RIGHT :
+            if not keep and p == start and not cells[p] :
+              start += 1
+            p += 1
+            if p >= stop :
+              if p >= len(cells) :
+                tape.start, tape.stop = start, stop
+                shift = tape.reserve(0, 1)
+                cells = tape.cells
+                start += shift
+                stop += shift
+                p += shift
+              stop = p + 1
+              tape.start, tape.stop = start, stop
+              tape.extended()
+          else :
+            cells[p] = a
+        previous_state = state
+        state = t.state
+        steps += 1
+        counts += t.counts
+    finally :
+      tape.start = start
+      tape.stop = stop
+      self.head = p - start
+      self.state = state
+      self.previous_state = previous_state
+      self.steps = steps
+      self.counts = counts
+
+
+  def run_tape(self, limit:int=None):
+    """
+    Équivalent de run_fast pour les rubans autres que Tape, qui passe par l'interface de BaseTape
+    """
+    tape = self.tape
+    move = tape.move
+    head = self.head
+    state = self.state
+    previous_state = self.previous_state
+    steps = self.steps
+    counts = self.counts
+    keep = self.keep_unused_tape
+    alphabet = self.alphabet
+    LEFT = Action.LEFT
+    RIGHT = Action.RIGHT
+    ACCEPT = State.ACCEPT
+    REJECT = State.REJECT
+    breaks = self.breaks
+    max_len = self.break_tape_len
+    skip = self._break_skip
+    if limit is None :
+      limit = -1
+    try :
+      while state is not ACCEPT and state is not REJECT and steps != limit :
+        code = tape[head]
+        if breaks is not None :
+          hit = breaks.get(state)
+          if hit is None :
+            hit = self.break_codes(state)
+          if (code in hit or max_len is not None and len(tape) > max_len) and steps != skip :
+            self._break = True
+            break
+        t = state.transitions.get(code)
+        if t is None :
+          t = state.transition(code, alphabet)
+        sweep = t.sweep
+        if sweep and (head > 0 if sweep > 0 else head < len(tape) - 1) and (breaks is None or not hit) :
+          stops = state.sweep_stops(sweep, alphabet)
+          if stops is not None :
+            h = tape.scan(head, sweep, stops, limit - steps if limit >= 0 else len(tape))
+            if h != head :
+              steps += abs(h - head)
+              counts += abs(h - head)
+              head = h
+              previous_state = state
+              continue
+        if t.fused and (keep or 0 < head + t.lo and head + t.hi < len(tape) - 1) :
+          if head + t.lo < 0 :
+            tape.grow_left(-head - t.lo)
+            head = -t.lo
+          if head + t.hi >= len(tape) :
+            tape.grow_right(head + t.hi - len(tape) + 1)
+          for o, c in t.writes :
+            tape[head + o] = c
+          head += t.delta
+          previous_state = state
+          state = t.state
+          steps += 1
+          counts += t.counts
+          continue
+        for a in t.ops :
+          if a is LEFT :
+            head = move(head, -1, keep)
+          elif a is RIGHT :
+            head = move(head, 1, keep)
+          else :
+            tape[head] = a
+        previous_state = state
+        state = t.state
+        steps += 1
+        counts += t.counts
+    finally :
+      self.head = head
+      self.state = state
+      self.previous_state = previous_state
+      self.steps = steps
+      self.counts = counts
+
+
+class RunStats(NamedTuple):
+  """
+  Résultat de Interpreter.execute : le résultat de run() (`status`), les nombres de pas, d'actions
+  et d'écritures depuis le début de l'exécution (y compris avant le point de reprise restauré par
+  resume), les positions absolues extrêmes de la fenêtre utilisée du ruban (cases parcourues par la
+  tête ou données en entrée) et sa plus grande taille, puis, pour cet appel, le nombre d'instances
+  de m-fonctions créées et la durée en secondes
+  """
+  status: int
+  steps: int
+  actions: int
+  prints: int
+  min_pos: int
+  max_pos: int
+  peak_tape: int
+  instances: int
+  elapsed: float
+
+  def todict(self) -> dict:
+    """
+    Dictionnaire des statistiques, `status` étant remplacé par son nom (ACCEPT, REJECT...)
+    """
+    rv = self._asdict()
+    rv['status'] = STATUS_NAMES.get(self.status, self.status)
+    return rv
+
+
+STATUS_NAMES = { getattr(Interpreter, n): n for n in ('ACCEPT', 'REJECT', 'STOPPED', 'LOOPING', 'SUSPENDED', 'BREAK') }
+
+
+class ReferenceInterpreter(Interpreter):
+  """
+  Moteur de référence : chaque action passe par perform_actions et BaseTape.move, sans balayage
+  ni transition fusionnée. Sert de point de comparaison pour les autres moteurs
+  """
+  AUTO = False
+
+  def run_fast(self, limit:int=None):
+    while self.state is not State.ACCEPT and self.state is not State.REJECT and self.steps != limit :
+      code = self.tape[self.head]
+      if self.breaks is not None and self.breaking(code, len(self.tape)) :
+        return
+      t = self.state.transitions.get(code)
+      if t is None :
+        t = self.state.transition(code, self.alphabet)
+      self.perform_actions(t.actions)
+      self.previous_state = self.state
+      self.state = t.state
+      self.steps += 1
+      self.counts += t.counts
+
+
+class BlockRun(NamedTuple):
+  """
+  Résultat mémorisé du parcours d'un bloc : son nouveau contenu, la position de la tête relative
+  au bloc (-1 ou la taille du bloc si elle en est sortie), l'état atteint, l'état précédent,
+  le nombre de pas effectués et les actions et écritures comptées (voir Transition.counts)
+  """
+  block: bytearray|array
+  offset: int
+  state: State
+  previous_state: State
+  steps: int
+  counts: int
+
+
+class MacroInterpreter(Interpreter):
+  """
+  Interpréteur par blocs : le ruban est découpé en blocs de `block_size` cases (alignés sur les
+  positions absolues) et le parcours d'un bloc, depuis un état, un contenu et une case d'entrée
+  donnés, n'est simulé qu'une fois puis servi depuis self.memo. Seuls les blocs strictement
+  à l'intérieur de la fenêtre utilisée sont traités ainsi (la fenêtre ne peut alors ni
+  s'étendre ni être rognée) ; ailleurs, la machine avance pas à pas avec run_fast.
+  Le ruban, l'état et le nombre de pas obtenus sont ceux de Interpreter.
+  """
+  MAX_BLOCK_STEPS = 10000
+  MAX_MEMO = 1 << 16
+  AUTO = False # Plus lent que Interpreter sauf sur les machines très répétitives
+  OPTIONS = ('block_size',)
+
+  def __init__(self, machine: AMachine, tape:list[str]|BaseTape, initpos=0, tape_backend:str='buffer', block_size:int=8):
+    super().__init__(machine, tape, initpos, tape_backend)
+    self.block_size = block_size
+    self.memo = {} # type: dict[tuple[State, bytes, int], BlockRun]
+
+  def block_run(self, state:State, block:bytearray|array, offset:int) -> BlockRun:
+    """
+    Simule la machine sur `block` (modifié en place) depuis la case `offset`, jusqu'à ce que la
+    tête sorte du bloc, que la machine s'arrête, ou que la prochaine transition sorte du bloc
+    avant son dernier déplacement (elle est alors laissée à run_fast)
+    """
+    k = len(block)
+    alphabet = self.alphabet
+    LEFT = Action.LEFT
+    RIGHT = Action.RIGHT
+    previous_state = None
+    steps = counts = 0
+    o = offset
+    while 0 <= o < k and steps < self.MAX_BLOCK_STEPS and state is not State.ACCEPT and state is not State.REJECT :
+      t = state.transitions.get(block[o])
+      if t is None :
+        t = state.transition(block[o], alphabet)
+      q = o
+      for a in t.ops[:-1] :
+        if a is LEFT :
+          q -= 1
+        elif a is RIGHT :
+          q += 1
+        if not 0 <= q < k :
+          break
+      else :
+        for a in t.ops :
+          if a is LEFT :
+            o -= 1
+          elif a is RIGHT :
+            o += 1
+          else :
+            block[o] = a
+        previous_state = state
+        state = t.state
+        steps += 1
+        counts += t.counts
+        continue
+      break
+    return BlockRun(block, o, state, previous_state, steps, counts)
+
+  def run_fast(self, limit:int=None):
+    tape = self.tape
+    if type(tape) is not Tape or self.breaks is not None :
+      return super().run_fast(limit)
+    k = self.block_size
+    memo = self.memo
+    while self.state is not State.ACCEPT and self.state is not State.REJECT and self.steps != limit :
+      cells = tape.cells
+      p = tape.start + self.head
+      b0 = p - (p - tape.base) % k
+      b1 = b0 + k
+      if tape.start < b0 and b1 < tape.stop :
+        block = cells[b0:b1]
+        key = (self.state, bytes(block), p - b0)
+        r = memo.get(key)
+        if r is None :
+          if len(memo) >= self.MAX_MEMO :
+            memo.clear()
+          r = memo[key] = self.block_run(self.state, block, p - b0)
+        if r.steps and (limit is None or self.steps + r.steps <= limit) :
+          cells[b0:b1] = r.block
+          self.head = b0 + r.offset - tape.start
+          self.state = r.state
+          self.previous_state = r.previous_state
+          self.steps += r.steps
+          self.counts += r.counts
+          continue
+      super().run_fast(self.steps + 1)
+
+
+ENGINES = {
+  'fast': Interpreter,
+  'macro': MacroInterpreter,
+  'reference': ReferenceInterpreter,
+} # type: dict[str, type[Interpreter]]
+
+
+def select_engine(name:str='auto', events:Event=Event(0)) -> type[Interpreter]:
+  """
+  Classe du moteur `name` (voir ENGINES). Pour 'auto', le premier moteur de ENGINES (classés du plus
+  rapide au plus lent) pouvant être choisi automatiquement et sachant signaler `events`
+  """
+  if name != 'auto' :
+    return ENGINES[name]
+  for cls in ENGINES.values() :
+    if cls.AUTO and events & cls.EVENTS == events :
+      return cls
+  raise ValueError(f'No engine can report {events!r}')
+
+def create_interpreter(machine:AMachine, tape:list[str]|BaseTape, engine:str='auto', events:Event=Event(0), initpos=0, tape_backend:str='buffer', **options) -> Interpreter:
+  """
+  Construit un interpréteur du moteur choisi par select_engine(engine, events). Les `options` que
+  le moteur ne connaît pas (voir Interpreter.OPTIONS) sont ignorées
+  """
+  cls = select_engine(engine, events)
+  return cls(machine, tape, initpos, tape_backend, **{ k: v for k, v in options.items() if k in cls.OPTIONS })
+
+
+class Recorder(object):
+  """
+  Enregistrement d'une exécution pour pouvoir y revenir : tous les `every` pas, une copie de
+  l'interpréteur (Interpreter.fork) est ajoutée à un anneau d'au plus `size` copies, la mémoire
+  restant ainsi bornée quelle que soit la durée de l'exécution. L'exécution étant déterministe,
+  seek() retrouve n'importe quel pas couvert par l'anneau en rejouant au plus `every` pas depuis
+  la copie précédente.
+  Le ruban par défaut (Tape) est d'abord converti en ChunkedTape, dont les copies partagent leurs
+  pages : une copie ne coûte alors que les pages modifiées depuis la précédente, et non tout le
+  ruban (au prix d'une boucle d'exécution plus lente).
+  """
+  def __init__(self, interp:Interpreter, every:int=10000, size:int=64):
+    tape = interp.tape
+    if type(tape) is Tape :
+      chunked = ChunkedTape(tape[:], tape.wide, origin=tape.position(0))
+      chunked.low, chunked.high, chunked.peak = tape.low, tape.high, tape.peak
+      interp.tape = chunked
+    self.every = every
+    self.snapshots = deque(maxlen=size) # type: deque[Interpreter]
+    self.record(interp)
+    self.observer = interp.observe(lambda events: self.record(interp), Event.STATE, every=every)
+
+  def record(self, interp:Interpreter):
+    """
+    Ajoute une copie de `interp` à l'anneau
+    """
+    snap = interp.replica()
+    if self.snapshots and self.snapshots[-1].steps == snap.steps :
+      self.snapshots.pop()
+    self.snapshots.append(snap)
+
+  @property
+  def first(self) -> int:
+    """
+    Premier pas que seek() peut retrouver
+    """
+    return self.snapshots[0].steps
+
+  @property
+  def last(self) -> int:
+    """
+    Dernier pas enregistré
+    """
+    return self.snapshots[-1].steps
+
+  def seek(self, step:int) -> Interpreter:
+    """
+    Nouvel interpréteur au pas `step` (ramené entre first et last), obtenu en rejouant
+    l'exécution depuis la dernière copie qui le précède
+    """
+    step = min(max(step, self.first), self.last)
+    snap = next( s for s in reversed(self.snapshots) if s.steps <= step )
+    rv = snap.fork()
+    if step > rv.steps :
+      rv.run(max_steps=step - rv.steps)
+    return rv
+
+
+class Frame(NamedTuple):
+  """
+  Image affichée par CLI.print_frame : fenêtre du ruban (symboles affichés), position de la tête,
+  nombre de cases affichées avant elle, nombre de cases non affichées après, état et action
+  """
+  reason: str
+  head: int
+  printed: list[str]
+  before_count: int
+  remaining: int
+  state: State
+  action: Action
+
+
+class Visualizer(threading.Thread):
+  """
+  Affiche les images transmises par offer() dans un thread séparé. Seule la dernière image reçue
+  est conservée : l'exécution n'attend jamais l'affichage, et les images arrivées pendant un
+  affichage sont abandonnées. close() affiche l'image en attente et arrête le thread.
+  """
+  def __init__(self, show:th.Callable[[Frame], None]):
+    super().__init__(daemon=True)
+    self.show = show
+    self.frame = None # type: Frame
+    self.closed = False
+    self.cond = threading.Condition()
+
+  def offer(self, frame:Frame):
+    with self.cond :
+      self.frame = frame
+      self.cond.notify()
+
+  def close(self):
+    with self.cond :
+      self.closed = True
+      self.cond.notify()
+    self.join()
+
+  def run(self):
+    while True :
+      with self.cond :
+        while self.frame is None and not self.closed :
+          self.cond.wait()
+        frame = self.frame
+        self.frame = None
+        if frame is None :
+          return
+      self.show(frame)
 
 
 class CLI(object):
   """
   Interface ligne de commande pour l'interpréteur
   """
-  def __init__(self, machine:AMachine):
+  def __init__(self, machine:AMachine, engine:str='auto'):
     self.machine = machine
+    self.engine = engine
     self.before = 10
     self.after = 10
+    self.next_frame = 0.
 
   @staticmethod
   def decorator(f):
     return reduce(lambda x, y: y(x), reversed((
       click.option('--keep-tape', '-k', is_flag=True, help='Keep unused tape (permits to watch the space usage of the machine)'),
+      click.option('--tape-backend', type=click.Choice(list(TAPE_BACKENDS)), default='buffer', help='Tape representation (rle compresses long runs of identical symbols, chunked shares its pages between forked interpreters, mmap spills the tape to a temporary file)'),
+      click.option('--engine', type=click.Choice(['auto'] + list(ENGINES)), default=None, help='Execution engine (auto picks the fastest one able to report the requested events, macro memoizes the runs through blocks of --block-size cells, reference performs every action one by one)'),
+      click.option('--block-size', type=int, default=8, help='Block size of the macro engine'),
+      click.option('--detect-cycles', is_flag=True, help='Stop when the machine is found looping forever'),
+      click.option('--checkpoint', default=None, help='Checkpoint file (defaults to the --resume file)'),
+      click.option('--checkpoint-every', type=int, default=0, help='Append a checkpoint every N steps'),
+      click.option('--resume', default=None, help='Resume from the last checkpoint of this file'),
       click.option('--print-print', '-p', is_flag=True, help='Print state on print action'),
       click.option('--print-action', '-a', is_flag=True, help='Print state on any action'),
       click.option('--print-state', '-t', is_flag=True, help='Print state on state end'),
       click.option('--halt-print', is_flag=True, help='Halt on prints'),
       click.option('--halt-action', is_flag=True, help='Halt on any action'),
       click.option('--halt-state', is_flag=True, help='Halt on state end'),
+      click.option('--break', 'breaks', multiple=True, metavar='STATE[:SYMBOL]', help='Stop before any step from STATE (a state or m-function name) reading SYMBOL (any if omitted), then trace step by step'),
+      click.option('--break-step', type=int, default=None, help='Stop before step N, then trace step by step'),
+      click.option('--break-tape-len', type=int, default=None, help='Stop as soon as the used tape exceeds N cells, then trace step by step'),
+      click.option('--record', is_flag=True, help='Record the run, then browse it step by step (forwards, backwards or to a given step)'),
+      click.option('--record-every', type=int, default=10000, help='Steps between two recorded snapshots (a browsed step is replayed from the previous one)'),
+      click.option('--record-size', type=int, default=64, help='Number of recorded snapshots kept (the oldest ones are dropped)'),
+      click.option('--progress-interval', type=float, default=0, help='Print a progress line on stderr every N seconds (also printed on SIGUSR1)'),
+      click.option('--stats', 'show_stats', is_flag=True, help='Print the run statistics (steps, actions, prints, tape extent, instances created, time)'),
+      click.option('--json', 'json_stats', is_flag=True, help='Print the run statistics as a JSON object'),
+      click.option('--fps', type=float, default=0, help='Maximum number of printed frames per second for the print options without halt, the others being dropped (0 prints every frame)'),
       click.option('--file-tape', '-f', help='The tape is imported from a space-separated file'),
       click.option('--string-tape', '-s', default=None, help='The tape is imported from a space separated string passed as argument'),
       click.option('--file-chars-tape', '-i', default=None, help='The tape is imported from a file split by chars'),
@@ -110,22 +1091,30 @@ class CLI(object):
       f
     )))
 
-  def print_machine(self, interp:Interpreter, halt, reason=None):
-    print(reason)
+  def snapshot(self, interp:Interpreter, reason=None) -> 'Frame':
+    """
+    Relève ce qu'affiche print_machine : la fenêtre du ruban autour de la tête, l'état et l'action
+    """
     pos = interp.head
     start = pos - self.before
     if start < 0:
       start = None
     end = min(len(interp.tape), pos+self.after)
-    printed = [ s if s else ' ' for s in interp.tape[start:end] ]
-    before_count = min(pos, self.before)
-    sizes = [len(s)+1 for s in printed]
+    symbols = interp.alphabet.symbols
+    printed = [ symbols[c] if c else ' ' for c in interp.tape[start:end] ]
+    return Frame(reason, pos, printed, min(pos, self.before), len(interp.tape) - end, interp.state, interp.cur_act)
+
+  def print_frame(self, frame:'Frame'):
+    print(frame.reason)
+    pos = frame.head
+    before_count = frame.before_count
+    sizes = [len(s)+1 for s in frame.printed]
     print(f'[{pos-before_count}]')
-    print('|'.join(printed))
+    print('|'.join(frame.printed))
     print((' ' * sum( s for s in sizes[:before_count] ) + '^' * (sizes[before_count] - 1)))
-    print(f'[...{len(interp.tape) - end} more]')
-    print(f'STATE : {interp.state.name}')
-    a = interp.cur_act
+    print(f'[...{frame.remaining} more]')
+    print(f'STATE : {frame.state.name}')
+    a = frame.action
     if a is None :
       pass
     elif a == Action.LEFT :
@@ -135,21 +1124,118 @@ class CLI(object):
     else :
       print(f'ACTION : print({a.symbol})')
     print()
+
+  def print_machine(self, interp:Interpreter, halt, reason=None):
+    self.print_frame(self.snapshot(interp, reason))
     if halt :
       try :
         input()
       except KeyboardInterrupt as e:
         raise StopMachine() from e
-      
+
+  def print_sampled(self, interp:Interpreter, reason, period:float):
+    """
+    print_machine sans arrêt, limité à une image toutes les `period` secondes
+    """
+    now = time.monotonic()
+    if now >= self.next_frame :
+      self.next_frame = now + period
+      self.print_machine(interp, False, reason)
+
+  def run_monitored(self, interp:Interpreter, reason, fps:float, interval:float) -> int:
+    """
+    Exécute `interp` par tranches de RUN_BATCH pas (ou de 1 / `fps` secondes si `reason`). Après
+    chaque tranche, une image est transmise à un Visualizer si `reason`, et l'avancement est
+    affiché sur la sortie d'erreur toutes les `interval` secondes ou à la réception de SIGUSR1.
+    La boucle d'exécution n'est ainsi jamais ralentie.
+    """
+    visualizer = None
+    if reason :
+      visualizer = Visualizer(self.print_frame)
+      visualizer.start()
+    signalled = []
+    handler = None
+    if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread() :
+      handler = signal.signal(signal.SIGUSR1, lambda signum, frame: signalled.append(signum))
+    last = (time.monotonic(), interp.steps)
+    try :
+      while True :
+        if reason :
+          res = interp.run(deadline=time.monotonic() + 1 / fps)
+          visualizer.offer(self.snapshot(interp, reason))
+        else :
+          res = interp.run(max_steps=Interpreter.RUN_BATCH)
+        if res != Interpreter.SUSPENDED :
+          return res
+        now = time.monotonic()
+        if signalled or interval and now >= last[0] + interval :
+          signalled.clear()
+          self.print_progress(interp, (interp.steps - last[1]) / max(now - last[0], 1e-9))
+          last = (now, interp.steps)
+    finally :
+      if visualizer is not None :
+        visualizer.close()
+      if handler is not None :
+        signal.signal(signal.SIGUSR1, handler)
+
+  def print_progress(self, interp:Interpreter, speed:float):
+    p = interp.progress()
+    print(
+      f'[progress] step {p["steps"]} ({speed:.0f} steps/s), tape [{p["start"]}, {p["stop"]}) head {p["head"]}, '
+      f'state {p["state"]}, instances {p["instances"]} alive / {p["created"]} created, transitions {p["transitions"]}',
+      file=sys.stderr, flush=True,
+    )
+
+  def browse(self, recorder:Recorder):
+    """
+    Parcours interactif d'une exécution enregistrée, depuis son dernier pas
+    """
+    print(f'Recorded steps {recorder.first} to {recorder.last}. Commands : [Enter]/n next step, p previous step, <N> go to step N, q quit')
+    view = recorder.seek(recorder.last)
+    while True :
+      self.print_machine(view, False, f'STEP {view.steps}')
+      try :
+        cmd = input('> ').strip()
+      except (KeyboardInterrupt, EOFError) :
+        return
+      if cmd in ('', 'n') :
+        step = view.steps + 1
+      elif cmd == 'p' :
+        step = view.steps - 1
+      elif cmd == 'q' :
+        return
+      elif cmd.isdigit() :
+        step = int(cmd)
+      else :
+        print(f'Unknown command {cmd!r}')
+        continue
+      view = recorder.seek(step)
 
   def main(self,
     keep_tape,
+    tape_backend,
+    engine,
+    block_size,
+    detect_cycles,
+    checkpoint,
+    checkpoint_every,
+    resume,
     print_print,
     print_action,
     print_state,
     halt_print,
     halt_action,
     halt_state,
+    breaks,
+    break_step,
+    break_tape_len,
+    record,
+    record_every,
+    record_size,
+    progress_interval,
+    show_stats,
+    json_stats,
+    fps,
     file_tape,
     string_tape,
     file_chars_tape,
@@ -169,17 +1255,62 @@ class CLI(object):
         tape = list(f.read())
     elif chars_tape is not None :
       tape = list(chars_tape)
+    elif resume is not None :
+      tape = []
     else :
       raise RuntimeError('No tape provided')
-    i = Interpreter(self.machine, tape)
+    events = Event(0)
     if print_print :
-      i.print_cb = lambda i: self.print_machine(i, halt_print, 'PRINT')
+      events |= Event.PRINT
     if print_action :
+      events |= Event.ACTION
+    if print_state or checkpoint_every :
+      events |= Event.STATE
+    i = create_interpreter(self.machine, tape, engine or self.engine, events, tape_backend=tape_backend, block_size=block_size)
+    # Avec --fps, les affichages sans arrêt sont échantillonnés : dans un Visualizer si l'exécution
+    # n'a aucun callback, sinon par print_sampled
+    sampled = [ reason for reason, printing, halt in (
+      ('PRINT', print_print, halt_print),
+      ('ACTION', print_action, halt_action),
+      ('STATE', print_state, halt_state),
+    ) if printing and fps and not halt ]
+    if print_print and 'PRINT' not in sampled :
+      i.print_cb = lambda i: self.print_machine(i, halt_print, 'PRINT')
+    if print_action and 'ACTION' not in sampled :
       i.action_cb = lambda i: self.print_machine(i, halt_action, 'ACTION')
-    if print_state :
+    if print_state and 'STATE' not in sampled :
       i.state_cb = lambda i: self.print_machine(i, halt_state, 'STATE')
+    visualized = None
+    if sampled and (i.print_cb or i.action_cb or i.state_cb) :
+      if 'PRINT' in sampled :
+        i.print_cb = lambda i: self.print_sampled(i, 'PRINT', 1 / fps)
+      if 'ACTION' in sampled :
+        i.action_cb = lambda i: self.print_sampled(i, 'ACTION', 1 / fps)
+      if 'STATE' in sampled :
+        i.state_cb = lambda i: self.print_sampled(i, 'STATE', 1 / fps)
+    elif sampled :
+      visualized = sampled[-1]
     i.keep_unused_tape = keep_tape
-    res = i.execute()
+    i.detect_cycles = detect_cycles
+    if resume is not None :
+      i.resume(resume)
+    if checkpoint_every :
+      path = checkpoint or resume
+      if path is None :
+        raise click.UsageError('--checkpoint-every requires --checkpoint or --resume')
+      i.observe(lambda events: i.checkpoint(path), Event.STATE, every=checkpoint_every)
+    recorder = Recorder(i, record_every, record_size) if record else None
+    if breaks or break_step is not None or break_tape_len is not None :
+      i.set_breakpoints([ (b.split(':', 1) + [None])[:2] for b in breaks ], break_step, break_tape_len)
+    created = State.instances.created
+    t0 = time.perf_counter()
+    res = self.run_monitored(i, visualized, fps, progress_interval)
+    while res == Interpreter.BREAK :
+      # Suite de l'exécution pas à pas
+      self.print_machine(i, False, 'BREAK')
+      i.state_cb = lambda i: self.print_machine(i, True, 'STATE')
+      res = i.execute().status
+    stats = i.stats(res, time.perf_counter() - t0, State.instances.created - created)
     print()
     if res == Interpreter.ACCEPT :
       print('ACCEPTED !')
@@ -189,10 +1320,21 @@ class CLI(object):
         print(f'Rejected at state : {i.previous_state.name}')
     elif res == Interpreter.STOPPED :
       print('STOPPED')
+    elif res == Interpreter.LOOPING :
+      print(f'LOOPING ! (cycle of {i.cycle_length} steps, reached at step {i.cycle_start})')
     else:
       print(f'ENDED with result {res}')
     print(f'STATE : {i.state.name}')
-    print('|'.join(s if s else '' for s in i.tape))
+    print('|'.join(i.symbols()))
+    if json_stats :
+      print(json.dumps(stats.todict()))
+    elif show_stats :
+      print()
+      for k, v in stats.todict().items() :
+        print(f'{k} : {v:.3f}' if isinstance(v, float) else f'{k} : {v}')
+    if recorder is not None :
+      recorder.record(i)
+      self.browse(recorder)
 
   def entry_point(self, name):
     @click.command(name=name)
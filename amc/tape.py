@@ -0,0 +1,685 @@
+"""
+Représentations du ruban bi-infini utilisé par l'interpréteur
+"""
+
+import copy
+import mmap
+import tempfile
+import typing as th
+from array import array
+from bisect import bisect_right
+
+
+class BaseTape(object):
+  """
+  Interface commune des rubans. Un ruban contient des symboles codés (voir ir.Alphabet), 0 étant
+  le symbole vide. Seule une fenêtre de cases est utilisée, toutes les autres sont vides.
+  Les indices publics (__getitem__, __setitem__, move...) sont relatifs à la première case
+  utilisée, position() donne la position absolue d'une case, indépendante des extensions
+  et rognages.
+  """
+  BLANK = 0
+  wide = False
+
+  def __len__(self):
+    raise NotImplementedError()
+
+  def __iter__(self):
+    return iter(self[:])
+
+  def __getitem__(self, i:int|slice) -> int|list[int]:
+    raise NotImplementedError()
+
+  def __setitem__(self, i:int, code:int):
+    raise NotImplementedError()
+
+  def position(self, i:int) -> int:
+    """
+    Position absolue de la case d'indice `i`
+    """
+    raise NotImplementedError()
+
+  def reset_extent(self):
+    """
+    Réinitialise self.low, self.high (positions absolues extrêmes atteintes par la fenêtre
+    utilisée, high exclue) et self.peak (sa plus grande taille) à la fenêtre actuelle
+    """
+    self.low = self.position(0)
+    self.high = self.low + len(self)
+    self.peak = len(self)
+
+  def extended(self):
+    """
+    Met à jour self.low, self.high et self.peak après une extension de la fenêtre
+    """
+    low = self.position(0)
+    n = len(self)
+    if low < self.low :
+      self.low = low
+    if low + n > self.high :
+      self.high = low + n
+    if n > self.peak :
+      self.peak = n
+
+  def widen(self):
+    """
+    Permet de stocker des codes supérieurs à 255
+    """
+    self.wide = True
+
+  def tobytes(self) -> bytes:
+    """
+    Contenu de la fenêtre utilisée, sous forme d'octets (deux par case si le ruban est large)
+    """
+    return array('H', self[:]).tobytes() if self.wide else bytes(self[:])
+
+  def fork(self) -> 'BaseTape':
+    """
+    Copie indépendante du ruban (en O(1) pour ChunkedTape)
+    """
+    raise NotImplementedError()
+
+  def grow_left(self, n:int=1):
+    raise NotImplementedError()
+
+  def grow_right(self, n:int=1):
+    raise NotImplementedError()
+
+  def trim_left(self):
+    raise NotImplementedError()
+
+  def trim_right(self):
+    raise NotImplementedError()
+
+  def move(self, head:int, delta:int, keep:bool=False) -> int:
+    """
+    Déplace la tête (indice relatif) d'une case vers la gauche (delta = -1) ou la droite (delta = 1),
+    et retourne sa nouvelle position. Le ruban est étendu si nécessaire, et, sauf si `keep`,
+    la case vide quittée est rognée si elle est au bord.
+    """
+    if delta < 0 :
+      if not keep and head == len(self) - 1 and not self[head] :
+        self.trim_right()
+      head -= 1
+      if head < 0 :
+        self.grow_left(-head)
+        head = 0
+    else :
+      if not keep and head == 0 and not self[0] :
+        self.trim_left()
+      else :
+        head += 1
+      if len(self) <= head :
+        self.grow_right(head - len(self) + 1)
+    return head
+
+  def scan(self, head:int, delta:int, stops:bytes, n:int) -> int:
+    """
+    Avance la tête (indice relatif) dans la direction `delta` jusqu'à la première case dont le code
+    est dans `stops`, sans dépasser `n` cases ni sortir de la fenêtre, et retourne sa position.
+    Le code de la case de départ ne doit pas être dans `stops`. Le ruban n'est pas modifié.
+    """
+    end = min(len(self) - 1, head + n) if delta > 0 else max(0, head - n)
+    while head != end :
+      head += delta
+      if self[head] in stops :
+        break
+    return head
+
+  def _index(self, i:int) -> int:
+    if i < 0 :
+      i += len(self)
+    if not 0 <= i < len(self) :
+      raise IndexError(i)
+    return i
+
+
+class Tape(BaseTape):
+  """
+  Ruban stocké dans un tampon (bytearray, ou array('H') au-delà de 256 symboles) ayant de la place
+  libre des deux côtés. Les cases utilisées sont self.cells[self.start:self.stop].
+  `self.base` est l'indice dans le tampon de la case d'origine (position absolue 0).
+  Étendre ou rogner la fenêtre d'un côté ou de l'autre est en O(1) amorti.
+  `origin` est la position absolue de la première case de `codes`.
+  """
+  MIN_ROOM = 16
+
+  def __init__(self, codes:th.Iterable[int]=(), wide:bool=False, origin:int=0):
+    codes = list(codes)
+    self.wide = wide or any( c > 0xff for c in codes )
+    room = max(len(codes), self.MIN_ROOM)
+    self.cells = self.blank(room)
+    self.cells += array('H', codes) if self.wide else bytearray(codes)
+    self.cells += self.blank(room)
+    self.start = room
+    self.stop = room + len(codes)
+    self.base = room - origin
+    self.reset_extent()
+
+  def blank(self, n:int) -> bytearray|array:
+    """
+    Retourne un tampon de `n` cases vides, du même type que celui du ruban
+    """
+    if self.wide :
+      return array('H', bytes(2 * n))
+    return bytearray(n)
+
+  def widen(self):
+    """
+    Passe le ruban en array('H'), pour les alphabets de plus de 256 symboles
+    """
+    if not self.wide :
+      self.wide = True
+      self.cells = array('H', iter(self.cells))
+
+  def __len__(self):
+    return self.stop - self.start
+
+  def __iter__(self):
+    return iter(self.cells[self.start:self.stop])
+
+  def tobytes(self) -> bytes:
+    cells = self.cells[self.start:self.stop]
+    return cells.tobytes() if self.wide else bytes(cells)
+
+  def fork(self) -> 'Tape':
+    rv = copy.copy(self)
+    rv.cells = self.cells[:]
+    return rv
+
+  def __getitem__(self, i:int|slice) -> int|list[int]:
+    if isinstance(i, slice) :
+      start, stop, step = i.indices(len(self))
+      if step != 1 :
+        return list(self)[i]
+      return list(self.cells[self.start + start:self.start + max(start, stop)])
+    return self.cells[self.start + self._index(i)]
+
+  def __setitem__(self, i:int, code:int):
+    self.cells[self.start + self._index(i)] = code
+
+  def position(self, i:int) -> int:
+    return self.start + i - self.base
+
+  def reserve(self, left:int, right:int) -> int:
+    """
+    S'assure qu'il y a au moins `left` cases libres avant la fenêtre et `right` après, en
+    réallouant le tampon (avec une marge proportionnelle à sa taille) si besoin.
+    Retourne le décalage appliqué aux indices du tampon.
+    """
+    cells = self.cells
+    free_right = len(cells) - self.stop
+    if self.start >= left and free_right >= right :
+      return 0
+    n = self.stop - self.start
+    room_left = self.start if self.start >= left else max(left, n, self.MIN_ROOM)
+    room_right = free_right if free_right >= right else max(right, n, self.MIN_ROOM)
+    self.cells = self.blank(room_left)
+    self.cells += cells[self.start:self.stop]
+    self.cells += self.blank(room_right)
+    shift = room_left - self.start
+    self.start += shift
+    self.stop += shift
+    self.base += shift
+    return shift
+
+  def grow_left(self, n:int=1):
+    self.reserve(n, 0)
+    self.start -= n
+    self.extended()
+
+  def grow_right(self, n:int=1):
+    self.reserve(0, n)
+    self.stop += n
+    self.extended()
+
+  def trim_left(self):
+    self.start += 1
+
+  def trim_right(self):
+    self.stop -= 1
+
+  def scan(self, head:int, delta:int, stops:bytes, n:int) -> int:
+    if self.wide :
+      return super().scan(head, delta, stops, n)
+    cells = self.cells
+    p = self.start + head
+    if delta > 0 :
+      q = min(self.stop - 1, p + n)
+      for c in stops :
+        f = cells.find(c, p + 1, q)
+        if f >= 0 :
+          q = f
+    else :
+      q = max(self.start, p - n)
+      for c in stops :
+        f = cells.rfind(c, q + 1, p)
+        if f >= 0 :
+          q = f
+    return q - self.start
+
+  def move(self, head:int, delta:int, keep:bool=False) -> int:
+    cells = self.cells
+    if delta < 0 :
+      if not keep and head == self.stop - self.start - 1 and not cells[self.stop - 1] :
+        self.stop -= 1
+      head -= 1
+      if head < 0 :
+        self.grow_left(-head)
+        head = 0
+    else :
+      if not keep and head == 0 and not cells[self.start] :
+        self.start += 1
+      else :
+        head += 1
+      if len(self) <= head :
+        self.grow_right(head - len(self) + 1)
+    return head
+
+
+class MmapTape(Tape):
+  """
+  Tape dont le tampon est la projection en mémoire (mmap) d'un fichier temporaire, créé dans
+  `directory` (celui de tempfile par défaut) : le système ne garde en mémoire que les pages
+  utilisées récemment et écrit les autres dans le fichier, ce qui permet des rubans plus grands
+  que la mémoire. Le fichier est creux, les cases vides jamais écrites ne l'occupent pas.
+  self.cells est une memoryview du fichier (format 'B', ou 'H' pour un ruban large).
+  """
+  directory = None # type: str
+  COPY_CHUNK = 1 << 20
+
+  def __init__(self, codes:th.Iterable[int]=(), wide:bool=False, origin:int=0):
+    codes = list(codes)
+    self.wide = wide or any( c > 0xff for c in codes )
+    self.mm = None # type: mmap.mmap
+    room = max(len(codes), self.MIN_ROOM)
+    self.allocate(2 * room + len(codes))
+    self.start = room
+    self.stop = room + len(codes)
+    self.base = room - origin
+    self.cells[self.start:self.stop] = array('H', codes) if self.wide else bytes(codes)
+    self.reset_extent()
+
+  def allocate(self, n:int):
+    """
+    Remplace le tampon par un nouveau fichier de `n` cases vides (le contenu n'est pas recopié)
+    """
+    if self.mm is not None :
+      self.cells.release()
+      self.mm.close()
+    size = n * (2 if self.wide else 1)
+    with tempfile.TemporaryFile(dir=self.directory) as f :
+      f.truncate(size)
+      self.mm = mmap.mmap(f.fileno(), size)
+    self.cells = memoryview(self.mm).cast('H') if self.wide else memoryview(self.mm)
+
+  def widen(self):
+    if not self.wide :
+      old = bytes(self.cells) # type: bytes
+      self.wide = True
+      self.allocate(len(old))
+      for i in range(0, len(old), self.COPY_CHUNK) :
+        self.cells[i:i + self.COPY_CHUNK] = array('H', iter(old[i:i + self.COPY_CHUNK]))
+
+  def reserve(self, left:int, right:int) -> int:
+    free_right = len(self.cells) - self.stop
+    if self.start >= left and free_right >= right :
+      return 0
+    n = self.stop - self.start
+    room_left = self.start if self.start >= left else max(left, n, self.MIN_ROOM)
+    room_right = free_right if free_right >= right else max(right, n, self.MIN_ROOM)
+    old_mm = self.mm
+    old = self.cells
+    self.mm = None
+    self.allocate(room_left + n + room_right)
+    self.cells[room_left:room_left + n] = old[self.start:self.stop]
+    old.release()
+    old_mm.close()
+    shift = room_left - self.start
+    self.start += shift
+    self.stop += shift
+    self.base += shift
+    return shift
+
+  def fork(self) -> 'MmapTape':
+    rv = copy.copy(self)
+    rv.mm = None
+    rv.allocate(len(self.cells))
+    rv.cells[:] = self.cells
+    return rv
+
+  def scan(self, head:int, delta:int, stops:bytes, n:int) -> int:
+    if self.wide :
+      return BaseTape.scan(self, head, delta, stops, n)
+    mm = self.mm
+    p = self.start + head
+    if delta > 0 :
+      q = min(self.stop - 1, p + n)
+      for c in stops :
+        f = mm.find(bytes((c,)), p + 1, q)
+        if f >= 0 :
+          q = f
+    else :
+      q = max(self.start, p - n)
+      for c in stops :
+        f = mm.rfind(bytes((c,)), q + 1, p)
+        if f >= 0 :
+          q = f
+    return q - self.start
+
+
+class RLETape(BaseTape):
+  """
+  Ruban compressé par plages : self.starts contient les positions absolues (croissantes) de début
+  des plages et self.codes leurs symboles. La plage i couvre [starts[i], starts[i+1]), la dernière
+  s'arrête à self.stop. Deux plages voisines n'ont jamais le même symbole.
+  Une écriture découpe la plage concernée et fusionne le résultat avec ses voisines ; la plage
+  de la dernière case accédée est mémorisée, ce qui rend les accès proches de la tête en O(1).
+  """
+  def __init__(self, codes:th.Iterable[int]=(), wide:bool=False, origin:int=0):
+    self.wide = wide
+    self.starts = [] # type: list[int]
+    self.codes = [] # type: list[int]
+    self.start = origin
+    self.stop = origin
+    self.cur = 0
+    for c in codes :
+      self.stop += 1
+      if self.codes and self.codes[-1] == c :
+        continue
+      self.starts.append(self.stop - 1)
+      self.codes.append(c)
+    self.reset_extent()
+
+  def __len__(self):
+    return self.stop - self.start
+
+  def runs(self) -> th.Iterator[tuple[int, int, int]]:
+    """
+    Itère sur les plages (début, fin, code), en positions absolues
+    """
+    starts = self.starts
+    for i, c in enumerate(self.codes) :
+      yield starts[i], starts[i + 1] if i + 1 < len(starts) else self.stop, c
+
+  def run(self, pos:int) -> int:
+    """
+    Indice de la plage contenant la position absolue `pos` (qui doit être dans la fenêtre)
+    """
+    starts = self.starts
+    i = self.cur
+    if i < len(starts) and starts[i] <= pos :
+      if i + 1 == len(starts) or pos < starts[i + 1] :
+        return i
+      if i + 2 == len(starts) or pos < starts[i + 2] :
+        self.cur = i + 1
+        return i + 1
+    elif 0 < i <= len(starts) and starts[i - 1] <= pos :
+      self.cur = i - 1
+      return i - 1
+    i = self.cur = bisect_right(starts, pos) - 1
+    return i
+
+  def __getitem__(self, i:int|slice) -> int|list[int]:
+    if isinstance(i, slice) :
+      start, stop, step = i.indices(len(self))
+      if step != 1 :
+        return list(self)[i]
+      rv = []
+      start += self.start
+      stop += self.start
+      if start < stop :
+        for s, e, c in self.runs() :
+          if e > start and s < stop :
+            rv.extend([c] * (min(e, stop) - max(s, start)))
+      return rv
+    return self.codes[self.run(self.start + self._index(i))]
+
+  def __setitem__(self, i:int, code:int):
+    pos = self.start + self._index(i)
+    r = self.run(pos)
+    codes = self.codes
+    if codes[r] == code :
+      return
+    starts = self.starts
+    end = starts[r + 1] if r + 1 < len(starts) else self.stop
+    # Découpe de la plage r en [starts[r], pos) [pos, pos+1) [pos+1, end)
+    if pos + 1 < end :
+      starts.insert(r + 1, pos + 1)
+      codes.insert(r + 1, codes[r])
+    if starts[r] < pos :
+      starts.insert(r + 1, pos)
+      codes.insert(r + 1, code)
+      r += 1
+    else :
+      codes[r] = code
+    # Fusion avec les voisines
+    if r + 1 < len(starts) and codes[r + 1] == code :
+      del starts[r + 1]
+      del codes[r + 1]
+    if r > 0 and codes[r - 1] == code :
+      del starts[r]
+      del codes[r]
+      r -= 1
+    self.cur = r
+
+  def position(self, i:int) -> int:
+    return self.start + i
+
+  def fork(self) -> 'RLETape':
+    rv = copy.copy(self)
+    rv.starts = self.starts[:]
+    rv.codes = self.codes[:]
+    return rv
+
+  def scan(self, head:int, delta:int, stops:bytes, n:int) -> int:
+    # On saute de plage en plage : seule la première case de chacune peut arrêter le balayage
+    starts = self.starts
+    codes = self.codes
+    pos = self.start + head
+    r = self.run(pos)
+    if delta > 0 :
+      end = min(self.stop - 1, pos + n)
+      while True :
+        r += 1
+        if r == len(starts) or starts[r] > end :
+          return end - self.start
+        if codes[r] in stops :
+          return starts[r] - self.start
+    else :
+      end = max(self.start, pos - n)
+      while True :
+        if r == 0 or starts[r] - 1 < end :
+          return end - self.start
+        r -= 1
+        if codes[r] in stops :
+          return starts[r + 1] - 1 - self.start
+
+  def grow_left(self, n:int=1):
+    self.start -= n
+    if self.codes and self.codes[0] == self.BLANK :
+      self.starts[0] = self.start
+    else :
+      self.starts.insert(0, self.start)
+      self.codes.insert(0, self.BLANK)
+      self.cur += 1
+    self.extended()
+
+  def grow_right(self, n:int=1):
+    if not self.codes or self.codes[-1] != self.BLANK :
+      self.starts.append(self.stop)
+      self.codes.append(self.BLANK)
+    self.stop += n
+    self.extended()
+
+  def trim_left(self):
+    self.start += 1
+    self.starts[0] = self.start
+    if self.start == self.stop or len(self.starts) > 1 and self.starts[1] == self.start :
+      del self.starts[0]
+      del self.codes[0]
+      self.cur = max(self.cur - 1, 0)
+
+  def trim_right(self):
+    self.stop -= 1
+    if self.starts[-1] == self.stop :
+      del self.starts[-1]
+      del self.codes[-1]
+
+
+class ChunkedTape(BaseTape):
+  """
+  Ruban découpé en pages de PAGE_SIZE cases, alignées sur les positions absolues : self.pages
+  associe à l'indice d'une page son tampon (bytearray, ou array('H')), les pages absentes étant
+  vides. La fenêtre utilisée est [self.start, self.stop), en positions absolues.
+  fork() partage les pages (et le dictionnaire self.pages) entre les deux rubans en O(1) : chacun
+  copie le dictionnaire à sa première écriture, et une page à sa première écriture dans celle-ci
+  (seules les pages de self.owned lui appartiennent).
+  """
+  SHIFT = 8
+  PAGE_SIZE = 1 << SHIFT
+  MASK = PAGE_SIZE - 1
+
+  def __init__(self, codes:th.Iterable[int]=(), wide:bool=False, origin:int=0):
+    codes = list(codes)
+    self.wide = wide or any( c > 0xff for c in codes )
+    self.pages = {} # type: dict[int, bytearray|array]
+    self.owned = set() # type: set[int]
+    self.shared = False
+    self.start = origin
+    self.stop = origin + len(codes)
+    for i, c in enumerate(codes) :
+      if c :
+        self.write(origin + i, c)
+    self.reset_extent()
+
+  def blank(self) -> bytearray|array:
+    if self.wide :
+      return array('H', bytes(2 * self.PAGE_SIZE))
+    return bytearray(self.PAGE_SIZE)
+
+  def widen(self):
+    if not self.wide :
+      self.wide = True
+      self.pages = { p: array('H', iter(page)) for p, page in self.pages.items() }
+      self.owned = set(self.pages)
+      self.shared = False
+
+  def fork(self) -> 'ChunkedTape':
+    rv = copy.copy(self)
+    self.owned = set()
+    rv.owned = set()
+    self.shared = rv.shared = True
+    return rv
+
+  def write(self, pos:int, code:int):
+    """
+    Écrit `code` à la position absolue `pos`, en copiant au besoin la page partagée
+    """
+    p = pos >> self.SHIFT
+    if p not in self.owned :
+      if self.shared :
+        self.pages = dict(self.pages)
+        self.shared = False
+      page = self.pages.get(p)
+      self.pages[p] = page[:] if page is not None else self.blank()
+      self.owned.add(p)
+    self.pages[p][pos & self.MASK] = code
+
+  def __len__(self):
+    return self.stop - self.start
+
+  def __getitem__(self, i:int|slice) -> int|list[int]:
+    if isinstance(i, slice) :
+      start, stop, step = i.indices(len(self))
+      if step != 1 :
+        return list(self)[i]
+      rv = []
+      pos = self.start + start
+      stop += self.start
+      while pos < stop :
+        p = pos >> self.SHIFT
+        base = p << self.SHIFT
+        end = min(stop, base + self.PAGE_SIZE)
+        page = self.pages.get(p)
+        rv.extend(page[pos - base:end - base] if page is not None else [0] * (end - pos))
+        pos = end
+      return rv
+    pos = self.start + self._index(i)
+    page = self.pages.get(pos >> self.SHIFT)
+    return page[pos & self.MASK] if page is not None else 0
+
+  def __setitem__(self, i:int, code:int):
+    self.write(self.start + self._index(i), code)
+
+  def position(self, i:int) -> int:
+    return self.start + i
+
+  def scan(self, head:int, delta:int, stops:bytes, n:int) -> int:
+    # Recherche page par page, les pages absentes ne contenant que des cases vides
+    if self.wide :
+      return super().scan(head, delta, stops, n)
+    pos = self.start + head
+    if delta > 0 :
+      end = min(self.stop - 1, pos + n)
+      lo = pos + 1
+      while lo <= end :
+        p = lo >> self.SHIFT
+        base = p << self.SHIFT
+        hi = min(end + 1, base + self.PAGE_SIZE)
+        page = self.pages.get(p)
+        if page is None :
+          if 0 in stops :
+            return lo - self.start
+        else :
+          q = hi
+          for c in stops :
+            f = page.find(c, lo - base, q - base)
+            if f >= 0 :
+              q = base + f
+          if q < hi :
+            return q - self.start
+        lo = hi
+    else :
+      end = max(self.start, pos - n)
+      hi = pos - 1
+      while hi >= end :
+        p = hi >> self.SHIFT
+        base = p << self.SHIFT
+        lo = max(end, base)
+        page = self.pages.get(p)
+        if page is None :
+          if 0 in stops :
+            return hi - self.start
+        else :
+          q = lo - 1
+          for c in stops :
+            f = page.rfind(c, q + 1 - base, hi + 1 - base)
+            if f >= 0 :
+              q = base + f
+          if q >= lo :
+            return q - self.start
+        hi = lo - 1
+    return end - self.start
+
+  def grow_left(self, n:int=1):
+    self.start -= n
+    self.extended()
+
+  def grow_right(self, n:int=1):
+    self.stop += n
+    self.extended()
+
+  def trim_left(self):
+    self.start += 1
+
+  def trim_right(self):
+    self.stop -= 1
+
+
+TAPE_BACKENDS = {
+  'buffer': Tape,
+  'rle': RLETape,
+  'chunked': ChunkedTape,
+  'mmap': MmapTape,
+} # type: dict[str, type[BaseTape]]
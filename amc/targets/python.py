@@ -1,16 +1,285 @@
 """
-Pour python, on serialize l'IR, et celle-ci est interprétée
+Pour python, trois modes :
+- 'ir' : on serialize l'IR, et celle-ci est interprétée par le runtime de amc ;
+- 'flat' : les instances de m-fonctions atteignables sont développées en états numérotés, et le
+  script généré les exécute directement, sans dépendre de amc (voir PythonTarget.dump_flat) ;
+- 'closure' : chaque m-function devient une fonction python de ses arguments, qui construit ses
+  instances à la demande, et le script généré ne dépend pas non plus de amc (voir
+  PythonTarget.dump_closure).
 """
 
 import typing as th
 from ..ir import *
 
 
+def line(pp:PrettyPrinter, text:str):
+  pp.write(text)
+  pp.nl()
+
+
+SCRIPT_HEADER = '''"""
+Machine de turing {name}, compilée par amc compile-python --mode {mode} : {description}.
+Ce script ne dépend pas de amc.
+"""
+
+import argparse
+from array import array
+
+SYMBOLS = {symbols}
+CODES = {{ s: i for i, s in enumerate(SYMBOLS) }}
+# Les symboles inconnus (absents de SYMBOLS) sont-ils acceptés sur le ruban initial
+OTHER = {other}
+
+ACCEPT = 1
+REJECT = 0
+STOPPED = -1
+'''
+
+RUN_HEADER = '''
+
+def run(tape:list[str], keep:bool=False, limit:int=-1) -> tuple[int, str, str|None, list[str], int]:
+  """
+  Exécute la machine sur `tape` jusqu'à son arrêt ou jusqu'au pas `limit`. Sauf si `keep`, les
+  cases vides quittées au bord du ruban sont rognées. Retourne le résultat (ACCEPT, REJECT ou
+  STOPPED), l'état atteint, l'état ayant rejeté, le ruban et le nombre de pas
+  """
+  symbols = list(SYMBOLS)
+  index = dict(CODES)
+  for x in tape :
+    if x not in index :
+      if not OTHER :
+        raise ValueError(f'Unknown symbol {x!r}')
+      index[x] = len(symbols)
+      symbols.append(x)
+  codes = [ index[x] for x in tape ]
+  narrow = len(symbols) <= 0x100 # Ruban en octets : les balayages utilisent find
+  known = narrow and len(symbols) == len(SYMBOLS) # Et sans symbole inconnu
+  blank = bytearray(1) if narrow else array('H', [0])
+  n = max(len(codes), 1)
+  cells = blank * n
+  cells.extend(codes)
+  cells.extend(blank * n)
+  start = p = n
+  stop = n + n
+  prev = None
+  steps = 0
+'''
+
+SCRIPT_MAIN = '''
+
+def main(argv:list[str]=None):
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--keep-tape', '-k', action='store_true', help='Keep unused tape')
+  tapes = parser.add_mutually_exclusive_group(required=True)
+  tapes.add_argument('--file-tape', '-f', help='The tape is imported from a space-separated file')
+  tapes.add_argument('--string-tape', '-s', help='The tape is imported from a space separated string passed as argument')
+  tapes.add_argument('--file-chars-tape', '-i', help='The tape is imported from a file split by chars')
+  tapes.add_argument('--chars-tape', '-c', help='The tape is imported from an argument string split by chars')
+  args = parser.parse_args(argv)
+  if args.file_tape is not None :
+    with open(args.file_tape, 'r') as f :
+      tape = f.read().split()
+  elif args.string_tape is not None :
+    tape = args.string_tape.split()
+  elif args.file_chars_tape is not None :
+    with open(args.file_chars_tape, 'r') as f :
+      tape = list(f.read())
+  else :
+    tape = list(args.chars_tape)
+  try :
+    res, state, previous, symbols, steps = run(tape, args.keep_tape)
+  except ValueError as e :
+    parser.error(str(e))
+  print()
+  if res == ACCEPT :
+    print('ACCEPTED !')
+  elif res == REJECT :
+    print('REJECTED !')
+    if previous is not None :
+      print(f'Rejected at state : {previous}')
+  print(f'STATE : {state}')
+  print('|'.join(symbols))
+
+
+if __name__ == '__main__' :
+  main()
+'''
+
+FLAT_STATES = '''
+# Noms des états, suivis de REJECT (-2) et ACCEPT (-1)
+STATES = {states}
+'''
+
+FLAT_RETURN = '''  result = ACCEPT if s == -1 else REJECT if s == -2 else STOPPED
+  return result, STATES[s], None if prev is None else STATES[prev], [ symbols[c] for c in cells[start:stop] ], steps
+'''
+
+
+CLOSURE_PRELUDE = '''
+# Déplacements dans les programmes des transitions composées (les écritures y sont des codes)
+LEFT = -1
+RIGHT = -2
+# Taille au-delà de laquelle les noms d'instances sont abrégés (voir Instance.name)
+NAME_LENGTH = {name_length}
+
+
+class Instance(object):
+  """
+  Instance de m-fonction : `table` donne, pour chaque code de symbole lu, la transition
+  (état suivant, écriture, déplacement) résolue à la première lecture par `resolve`. L'écriture
+  vaut -1 s'il n'y en a pas ; si elle vaut -2, le déplacement est le programme de la transition ;
+  si elle vaut -3, la transition est un balayage, arrêté par les codes de `stops`
+  """
+  __slots__ = ('table', 'resolve', 'stops', 'template', 'args', 'values')
+
+  def __init__(self, n:int, template:str, args:tuple[str, ...]=(), values:tuple=()):
+    self.table = [None] * n
+    self.resolve = None
+    self.stops = ()
+    self.template = template
+    self.args = args
+    self.values = values
+
+  def name(self, symbols:list[str], budget:int=NAME_LENGTH) -> str:
+    """
+    Nom de l'instance, d'environ `budget` caractères au plus : les instances imbriquées et les
+    arguments qui ne tiennent plus sont abrégés en `m-fonction(…)` et `…`
+    """
+    if not self.args :
+      return self.template
+    budget -= len(self.template) + 2
+    if budget <= 0 :
+      return f'{self.template}(…)'
+    values = []
+    for a, v in zip(self.args, self.values) :
+      if budget <= 0 :
+        values.append('…')
+        break
+      value = f'{a}={v.name(symbols, budget - len(a) - 1) if isinstance(v, Instance) else symbols[v]}'
+      budget -= len(value) + 2
+      values.append(value)
+    return f'{self.template}({", ".join(values)})'
+
+
+ACCEPT_STATE = Instance(0, 'ACCEPT()')
+REJECT_STATE = Instance(0, 'REJECT()')
+
+
+def transition(state:Instance, write:int, move:int, c:int) -> tuple:
+  """
+  Transition d'au plus une écriture suivie d'au plus un déplacement, le symbole lu étant `c`
+  """
+  return (state, -1 if write == c else write, move)
+'''
+
+CLOSURE_LOOP = '''  state = machine(len(symbols))
+  while state is not ACCEPT_STATE and state is not REJECT_STATE and steps != limit :
+    c = cells[p]
+    t = state.table[c]
+    if t is None :
+      t = state.table[c] = state.resolve(c)
+    following, w, d = t
+    if w >= 0 :
+      cells[p] = w
+    elif w == -3 and start < p < stop - 1 and narrow :
+      # Balayage à l'intérieur de la fenêtre : aucun rognage ni extension possible
+      if d > 0 :
+        q = stop - 1 if limit < 0 else min(stop - 1, p + limit - steps)
+        for x in state.stops :
+          f = cells.find(x, p + 1, q)
+          if f >= 0 :
+            q = f
+        steps += q - p
+      else :
+        q = start if limit < 0 else max(start, p - limit + steps)
+        for x in state.stops :
+          f = cells.rfind(x, q + 1, p)
+          if f >= 0 :
+            q = f
+        steps += p - q
+      p = q
+      prev = state
+      continue
+    if d == 1 :
+      if p == start and not keep and not cells[p] :
+        start += 1
+      p += 1
+      if p >= stop :
+        if p >= len(cells) :
+          cells.extend(blank * len(cells))
+        stop = p + 1
+    elif d == -1 :
+      if p == stop - 1 and not keep and not cells[p] :
+        stop -= 1
+      p -= 1
+      if p < start :
+        if p < 0 :
+          g = len(cells)
+          cells[0:0] = blank * g
+          p += g
+          stop += g
+        start = p
+    elif d :
+      for a in d :
+        if a == RIGHT :
+          if p == start and not keep and not cells[p] :
+            start += 1
+          p += 1
+          if p >= stop :
+            if p >= len(cells) :
+              cells.extend(blank * len(cells))
+            stop = p + 1
+        elif a == LEFT :
+          if p == stop - 1 and not keep and not cells[p] :
+            stop -= 1
+          p -= 1
+          if p < start :
+            if p < 0 :
+              g = len(cells)
+              cells[0:0] = blank * g
+              p += g
+              stop += g
+            start = p
+        else :
+          cells[p] = a
+    prev = state
+    state = following
+    steps += 1
+  result = ACCEPT if state is ACCEPT_STATE else REJECT if state is REJECT_STATE else STOPPED
+  return result, state.name(symbols), prev.name(symbols) if result == REJECT and prev is not None else None, [ symbols[c] for c in cells[start:stop] ], steps
+'''
+
+
+def flat_ops(ops:tuple, code:int) -> tuple:
+  """
+  `ops` (voir Transition) sans les écritures d'un symbole déjà présent, la case lue contenant `code`
+  """
+  cell = {0: code}
+  o = 0
+  rv = []
+  for a in ops :
+    if a is Action.LEFT :
+      o -= 1
+    elif a is Action.RIGHT :
+      o += 1
+    elif cell.get(o) == a :
+      continue
+    else :
+      cell[o] = a
+    rv.append(a)
+  return tuple(rv)
+
+
 class PythonTarget(object):
   """
   Compile the ir to python
   """
-  def __init__(self):
+  MODES = ('ir', 'flat', 'closure')
+
+  def __init__(self, engine:str='auto', mode:str='ir', max_states:int=100000):
+    self.engine = engine # Moteur par défaut du script généré (voir runtime.ENGINES)
+    self.mode = mode
+    self.max_states = max_states # Nombre maximal d'états développés en mode 'flat'
     self.amachine = None #type: AMachine
     self.states = None # type: list[State]
     self.state_index = {} # type: dict[State, int]
@@ -18,6 +287,10 @@ class PythonTarget(object):
   def dump(self, amachine:AMachine, f:th.IO, name):
     self.amachine = amachine
     pp = PrettyPrinter(f)
+    if self.mode == 'flat' :
+      return self.dump_flat(pp, name)
+    if self.mode == 'closure' :
+      return self.dump_closure(pp, name)
     pp.write('''
 from amc.ir import *
 from amc.runtime import *
@@ -32,7 +305,7 @@ from amc.runtime import *
     pp.write(f'''
 machine = AMachine(symbols, states, init_state)
 
-cli = CLI(machine)
+cli = CLI(machine, {repr(self.engine)})
 cli.entry_point({repr(name)})
 ''')
 
@@ -149,13 +422,13 @@ cli.entry_point({repr(name)})
     elif isinstance(a, ActionPrint) :
       pp.write(f'ActionPrint({repr(a.symbol)})')
     elif isinstance(a, DynPrint) :
-      pp.write(f'DynPrint({repr(a.dyn_symbol)})')
+      pp.write(f'DynPrint({repr(a.dyn_symbol)}, {a.slot})')
     else :
       raise RuntimeError('Unknown Action type')
 
   def dump_stateref(self, pp:PrettyPrinter, sr:StateReference):
     if isinstance(sr, StatePlaceholder) :
-      pp.write(f'StatePlaceholder({repr(sr.ph_name)})')
+      pp.write(f'StatePlaceholder({repr(sr.ph_name)}, {sr.slot})')
     elif isinstance(sr, StaticStateReference) :
       pp.write(f'StaticStateReference({self.target_state(sr.state)}, ')
       if not sr.args :
@@ -165,6 +438,8 @@ cli.entry_point({repr(name)})
         for a in sr.args :
           if isinstance(a, str) :
             pp.write(repr(a))
+          elif isinstance(a, SymbolPlaceholder) :
+            pp.write(f'SymbolPlaceholder({repr(a.ph_name)}, {a.slot})')
           else :
             self.dump_stateref(pp, a)
           pp.write(',')
@@ -172,7 +447,365 @@ cli.entry_point({repr(name)})
       pp.write(')')
     else :
       raise RuntimeError('Unknown StateReference type')
-        
-    
 
-    
+
+  # Mode 'flat'
+
+  def flatten(self):
+    """
+    Développe les états atteignables depuis l'état initial en résolvant leur transition pour
+    chaque symbole de l'alphabet (étendu au besoin par les symboles écrits) et pour un symbole
+    inconnu (voir other_transition) : self.states reçoit les états concrets (aucun si l'état
+    initial est ACCEPT ou REJECT), numérotés par self.state_index, et self.others leur transition
+    pour un symbole inconnu
+    """
+    alphabet = self.amachine.alphabet
+    init = self.amachine.init_state.instanciate()
+    self.states = [] if init is State.ACCEPT or init is State.REJECT else [init]
+    self.state_index = { s: i for i, s in enumerate(self.states) }
+    self.others = [] # type: list[tuple[tuple, State]|None]
+    resolved = [0] * len(self.states)
+    changed = True
+    while changed :
+      changed = False
+      for i, s in enumerate(self.states) :
+        targets = []
+        if len(self.others) == i :
+          other = self.other_transition(s)
+          self.others.append(other)
+          if other is not None :
+            targets.append(other[1])
+        while resolved[i] < len(alphabet) :
+          targets.append(s.transition(resolved[i], alphabet).state)
+          resolved[i] += 1
+        for state in targets :
+          changed = True
+          if state in self.state_index or state is State.ACCEPT or state is State.REJECT :
+            continue
+          if len(self.states) >= self.max_states :
+            raise ValueError(f'More than {self.max_states} reachable states, the machine cannot be flattened')
+          self.state_index[state] = len(self.states)
+          self.states.append(state)
+          resolved.append(0)
+
+  def other_transition(self, state:State) -> tuple[tuple, State]|None:
+    """
+    Transition de `state` pour un symbole hors de l'alphabet (lu sur le ruban initial) : (ops, état
+    suivant), ou None si elle dépend du symbole. Un tel symbole n'a pas de règle propre, il relève
+    donc de la règle par défaut
+    """
+    template = state.template if isinstance(state, StateInstance) else state
+    if template.default_rule is not None and template.default_rule.uses_slot(len(template.args)) :
+      return None
+    r = state.instanciate_default(None)
+    alphabet = self.amachine.alphabet
+    return tuple( alphabet.encode(a.symbol) if isinstance(a, ActionPrint) else a for a in r.actions ), r.finalState
+
+  def dump_flat(self, pp:PrettyPrinter, name):
+    self.flatten()
+    symbols = self.amachine.alphabet.symbols
+    names = [ s.name for s in self.states ] + [State.REJECT.name, State.ACCEPT.name]
+    pp.write(SCRIPT_HEADER.format(
+      name=name,
+      mode='flat',
+      description=f'les instances de m-fonctions\natteignables sont développées en {len(self.states)} états numérotés',
+      symbols=repr(symbols),
+      other=all( o is not None for o in self.others ),
+    ))
+    pp.write(FLAT_STATES.format(states=repr(names)))
+    pp.write(RUN_HEADER)
+    init = self.amachine.init_state.instanciate()
+    line(pp, f'  s = {-1 if init is State.ACCEPT else -2 if init is State.REJECT else 0}')
+    if self.states :
+      line(pp, '  while s >= 0 and steps != limit :')
+      pp>>2
+      self.dump_flat_dispatch(pp, 0, len(self.states))
+      pp<<2
+    pp.write(FLAT_RETURN)
+    pp.write(SCRIPT_MAIN)
+
+  def dump_flat_dispatch(self, pp:PrettyPrinter, lo:int, hi:int):
+    """
+    Sélection de l'état `s` parmi [lo, hi) par dichotomie
+    """
+    if hi - lo == 1 :
+      return self.dump_flat_state(pp, lo)
+    mid = (lo + hi) // 2
+    line(pp, f'if s < {mid} :')
+    pp>>1
+    self.dump_flat_dispatch(pp, lo, mid)
+    pp<<1
+    line(pp, 'else :')
+    pp>>1
+    self.dump_flat_dispatch(pp, mid, hi)
+    pp<<1
+
+  def dump_flat_state(self, pp:PrettyPrinter, k:int):
+    """
+    Un état : sélection de la transition selon le symbole lu. Les transitions identiques (à une
+    réécriture du symbole lu près) sont regroupées, le groupe des symboles inconnus (codes au-delà
+    de l'alphabet), ou à défaut le plus gros, allant dans le `else`. Si l'état boucle sur lui-même,
+    il est exécuté dans sa propre boucle, dont on ne sort que pour changer d'état. Les boucles
+    d'un seul déplacement sont des balayages (voir dump_flat_sweep)
+    """
+    state = self.states[k]
+    alphabet = self.amachine.alphabet
+    transitions = {} # type: dict[tuple, list[int]]
+    for code in range(len(alphabet)) :
+      t = state.transition(code, alphabet)
+      transitions.setdefault((t.ops, t.state), []).append(code)
+    other = all( o is not None for o in self.others )
+    if other :
+      transitions.setdefault(self.others[k], []).append(len(alphabet))
+    groups = {} # type: dict[tuple, list[int]]
+    for (ops, target), codes in transitions.items() :
+      flat = { flat_ops(ops, c) for c in codes }
+      groups.setdefault((flat.pop() if len(flat) == 1 else ops, target), []).extend(codes)
+    groups = sorted(groups.items(), key=lambda g: (len(g[1]), -g[1][0]), reverse=True)
+    last = next( g for g in groups if len(alphabet) in g[1] ) if other else groups[0]
+    groups.remove(last)
+    groups.append(last)
+    looping = any( target is state for (ops, target), codes in groups )
+    line(pp, f'# {state.name}')
+    if looping :
+      line(pp, 'while steps != limit :')
+      pp>>1
+    if len(groups) > 1 :
+      line(pp, 'c = cells[p]')
+    for i, ((ops, target), codes) in enumerate(groups) :
+      if len(groups) > 1 :
+        if i == len(groups) - 1 :
+          line(pp, 'else :')
+        else :
+          test = f'c == {codes[0]}' if len(codes) == 1 else f'c in {tuple(codes)}'
+          line(pp, f'{"elif" if i else "if"} {test} :')
+        pp>>1
+      stops = [ c for c in range(len(alphabet)) if c not in codes ]
+      if target is state and len(ops) == 1 and ops[0] in (Action.LEFT, Action.RIGHT) and len(stops) <= State.MAX_SWEEP_STOPS :
+        self.dump_flat_sweep(pp, -1 if ops[0] is Action.LEFT else 1, stops, other and len(alphabet) not in codes)
+        pp>>1
+        self.dump_flat_transition(pp, k, ops, target, codes, looping)
+        pp<<1
+      else :
+        self.dump_flat_transition(pp, k, ops, target, codes, looping)
+      if len(groups) > 1 :
+        pp<<1
+    if looping :
+      pp<<1
+
+  def dump_flat_sweep(self, pp:PrettyPrinter, direction:int, stops:list[int], known:bool):
+    """
+    Balayage à l'intérieur de la fenêtre (aucun rognage ni extension possible) : la tête avance
+    jusqu'à la première case dont le code est dans `stops` (voir Tape.scan), les autres cas
+    étant laissés à la transition qui suit le `else`. Si `known`, les symboles inconnus arrêtent
+    aussi le balayage, qui n'est alors fait que si le ruban n'en contient pas
+    """
+    line(pp, f'if start < p < stop - 1 and {"known" if known else "narrow"} :')
+    pp>>1
+    if direction > 0 :
+      line(pp, 'q = stop - 1 if limit < 0 else min(stop - 1, p + limit - steps)')
+      find = 'cells.find({}, p + 1, q)'
+    else :
+      line(pp, 'q = start if limit < 0 else max(start, p - limit + steps)')
+      find = 'cells.rfind({}, q + 1, p)'
+    for c in stops :
+      line(pp, f'f = {find.format(c)}')
+      line(pp, 'if f >= 0 :')
+      line(pp, '  q = f')
+    line(pp, f'steps += {"q - p" if direction > 0 else "p - q"}')
+    line(pp, 'p = q')
+    pp<<1
+    line(pp, 'else :')
+
+  def dump_flat_transition(self, pp:PrettyPrinter, k:int, ops:tuple, target:State, codes:list[int], looping:bool):
+    """
+    Les actions d'une transition, puis le changement d'état. `cell` donne, pour chaque décalage
+    par rapport à la case lue, les codes possibles de la case : le rognage n'y est testé que s'il
+    peut avoir lieu, et les écritures qui ne changent rien sont omises
+    """
+    cell = {0: set(codes)}
+    o = 0
+    for a in ops :
+      known = cell.get(o)
+      if a is Action.LEFT or a is Action.RIGHT :
+        if known is None or 0 in known :
+          test = '' if known == {0} else ' and not cells[p]'
+          if a is Action.LEFT :
+            line(pp, f'if p == stop - 1 and not keep{test} :')
+            line(pp, '  stop -= 1')
+          else :
+            line(pp, f'if p == start and not keep{test} :')
+            line(pp, '  start += 1')
+        if a is Action.LEFT :
+          o -= 1
+          line(pp, 'p -= 1')
+          line(pp, 'if p < start :')
+          line(pp, '  if p < 0 :')
+          line(pp, '    g = len(cells)')
+          line(pp, '    cells[0:0] = blank * g')
+          line(pp, '    p += g')
+          line(pp, '    stop += g')
+          line(pp, '  start = p')
+        else :
+          o += 1
+          line(pp, 'p += 1')
+          line(pp, 'if p >= stop :')
+          line(pp, '  if p >= len(cells) :')
+          line(pp, '    cells.extend(blank * len(cells))')
+          line(pp, '  stop = p + 1')
+      elif known != {a} :
+        cell[o] = {a}
+        line(pp, f'cells[p] = {a}')
+    line(pp, 'steps += 1')
+    if target is self.states[k] :
+      return
+    if target is State.ACCEPT :
+      line(pp, 's = -1')
+    elif target is State.REJECT :
+      line(pp, f'prev = {k}')
+      line(pp, 's = -2')
+    else :
+      line(pp, f's = {self.state_index[target]}')
+    if looping :
+      line(pp, 'break')
+
+
+  # Mode 'closure'
+
+  def dump_closure(self, pp:PrettyPrinter, name):
+    """
+    Les m-fonctions (et les états simples, sans argument) deviennent des fonctions m<i>, définies
+    dans machine(n) pour un alphabet de n symboles. Elles prennent les codes des symboles et les
+    instances déjà construites des états en arguments, et construisent l'instance au premier
+    appel : seules les instances atteintes à l'exécution existent. Les règles sont compilées dans
+    la fonction resolve de l'instance, une fermeture sur ses arguments
+    """
+    self.states = list(self.amachine.states)
+    self.state_index = { s: i for i, s in enumerate(self.states) }
+    pp.write(SCRIPT_HEADER.format(
+      name=name,
+      mode='closure',
+      description='chaque m-fonction est une\nfonction python qui construit ses instances à la demande',
+      symbols=repr(self.amachine.alphabet.symbols),
+      other=True,
+    ))
+    pp.write(CLOSURE_PRELUDE.replace('{name_length}', str(State.NAME_LENGTH)))
+    pp.nl()
+    pp.nl()
+    line(pp, 'def machine(n:int) -> Instance:')
+    pp>>1
+    line(pp, '"""')
+    line(pp, 'M-fonctions de la machine pour un alphabet de `n` symboles ; retourne l\'état initial')
+    line(pp, '"""')
+    for i, s in enumerate(self.states) :
+      self.dump_closure_state(pp, i, s)
+    line(pp, f'return {self.closure_stateref(self.amachine.init_state, None)}')
+    pp<<1
+    pp.write(RUN_HEADER)
+    pp.write(CLOSURE_LOOP)
+    pp.write(SCRIPT_MAIN)
+
+  def dump_closure_state(self, pp:PrettyPrinter, i:int, state:State):
+    """
+    La fonction m<i> de `state`. Dans resolve, les règles sont testées de la dernière à la première,
+    la dernière définie l'emportant (voir State.symbol_heads), puis vient la règle par défaut
+    """
+    params = ', '.join( f'a{k}' for k in range(len(state.args)) )
+    alphabet = self.amachine.alphabet
+    line(pp, f'instances{i} = {{}}')
+    line(pp, f'def m{i}({params}):')
+    pp>>1
+    line(pp, f'# {state.name}')
+    line(pp, f'key = ({params}{"," if len(state.args) == 1 else ""})')
+    line(pp, f'rv = instances{i}.get(key)')
+    line(pp, 'if rv is None :')
+    pp>>1
+    line(pp, f'rv = instances{i}[key] = Instance(n, {state.name!r}, {tuple(state.args)!r}, key)')
+    line(pp, 'def resolve(c):')
+    pp>>1
+    heads = []
+    for head, rule in reversed(state.rules.items()) :
+      if head in state.args :
+        heads.append(f'a{state.args.index(head)}')
+      else :
+        heads.append(str(alphabet.encode(head)))
+      line(pp, f'if c == {heads[-1]} :')
+      line(pp, f'  return {self.closure_rule(rule, state)}')
+    sweep = self.closure_sweep(state)
+    if state.default_rule is None :
+      line(pp, 'return (REJECT_STATE, -1, 0)')
+    elif sweep and len(heads) <= State.MAX_SWEEP_STOPS :
+      line(pp, f'return (rv, -3, {sweep})')
+    else :
+      line(pp, f'return {self.closure_rule(state.default_rule, state)}')
+      sweep = 0
+    pp<<1
+    line(pp, 'rv.resolve = resolve')
+    if sweep :
+      line(pp, f'rv.stops = ({", ".join(heads)}{"," if heads else ""})')
+    pp<<1
+    line(pp, 'return rv')
+    pp<<1
+
+  def closure_sweep(self, state:State) -> int:
+    """
+    -1 ou 1 si la règle par défaut de `state` est un balayage (un seul déplacement, vers la même
+    instance, sans dépendre du symbole lu), 0 sinon. Le balayage n'est alors arrêté que par les
+    têtes des règles explicites (voir State.sweep_stops)
+    """
+    r = state.default_rule
+    if r is None or len(r.actions) != 1 or r.actions[0] not in (Action.LEFT, Action.RIGHT) :
+      return 0
+    f = r.finalState
+    if not isinstance(f, StaticStateReference) or f.state is not state or len(f.args) != len(state.args) :
+      return 0
+    if any( not isinstance(a, (SymbolPlaceholder, StatePlaceholder)) or a.slot != k for k, a in enumerate(f.args) ) :
+      return 0
+    return -1 if r.actions[0] is Action.LEFT else 1
+
+  def closure_slot(self, slot:int, template:State) -> str:
+    """
+    Variable de l'indice `slot` du contexte : un argument, ou le symbole lu pour la règle par défaut
+    """
+    return 'c' if slot == len(template.args) else f'a{slot}'
+
+  def closure_rule(self, rule:DynRule, template:State) -> str:
+    following = self.closure_stateref(rule.finalState, template)
+    ops = []
+    for a in rule.actions :
+      if a is Action.LEFT :
+        ops.append('LEFT')
+      elif a is Action.RIGHT :
+        ops.append('RIGHT')
+      elif isinstance(a, ActionPrint) :
+        ops.append(str(self.amachine.alphabet.encode(a.symbol)))
+      elif isinstance(a, DynPrint) :
+        ops.append(self.closure_slot(a.slot, template))
+      else :
+        raise RuntimeError('Unknown Action type')
+    moves = [ a for a in ops if a in ('LEFT', 'RIGHT') ]
+    if len(ops) - len(moves) <= 1 and len(moves) <= 1 and (not moves or ops[-1] == moves[0]) :
+      write = '-1' if len(moves) == len(ops) else ops[0]
+      move = '0' if not moves else '-1' if moves[0] == 'LEFT' else '1'
+      return f'transition({following}, {write}, {move}, c)'
+    return f'({following}, -2, ({", ".join(ops)},))'
+
+  def closure_stateref(self, sr:StateReference, template:State|None) -> str:
+    if isinstance(sr, StatePlaceholder) :
+      return self.closure_slot(sr.slot, template)
+    elif isinstance(sr, StaticStateReference) :
+      if sr.state is State.ACCEPT :
+        return 'ACCEPT_STATE'
+      elif sr.state is State.REJECT :
+        return 'REJECT_STATE'
+      args = []
+      for a in sr.args :
+        if isinstance(a, str) :
+          args.append(str(self.amachine.alphabet.encode(a)))
+        elif isinstance(a, SymbolPlaceholder) :
+          args.append(self.closure_slot(a.slot, template))
+        else :
+          args.append(self.closure_stateref(a, template))
+      return f'm{self.state_index[sr.state]}({", ".join(args)})'
+    else :
+      raise RuntimeError('Unknown StateReference type')
@@ -42,15 +42,16 @@ def test_ast(cli, m):
     cli.main(['ast', f'./examples/{m}.amachine'])
 
 
+@pytest.mark.parametrize('mode', ['ir', 'flat', 'closure'])
 @pytest.mark.parametrize('m', [
   'tm',
   '01',
   '01_n_times',
   'interlace',
 ])
-def test_compile(cli, m):
+def test_compile(cli, m, mode):
   with pytest.raises(SystemExit, match='0'):
-    cli.main(['compile-python', f'./examples/{m}.amachine'])
+    cli.main(['compile-python', '--mode', mode, f'./examples/{m}.amachine'])
   
   
 @pytest.mark.parametrize('m', [
@@ -62,3 +63,566 @@ def test_exec(cli, m):
   with pytest.raises(SystemExit, match='0'):
     cli.main(['exec', '-c', '25', f'./examples/{m}.amachine'])
 
+
+
+@pytest.fixture
+def machine():
+  from pathlib import Path
+  from amc import buildIR
+  def build(m):
+    path = Path(f'./examples/{m}.amachine').resolve()
+    with open(path, 'r') as f :
+      return buildIR(f, path)
+  return build
+
+def test_instances_interned(machine):
+  from amc.ir import State, InstanceCache
+  m = machine('01_n_times')
+  s = m.init_state.instanciate()
+  assert s is m.init_state.instanciate()
+  cache = InstanceCache(maxsize=1)
+  cache.add(('a',), s)
+  cache.add(('b',), State.ACCEPT)
+  assert list(cache.recent) == [('b',)]
+  assert cache.get(('a',)) is s
+
+def test_instances_bounded(machine, monkeypatch):
+  import gc
+  from amc.ir import State, InstanceCache
+  from amc.runtime import Interpreter
+  monkeypatch.setattr(State, 'instances', InstanceCache(maxsize=8))
+  m = machine('01_n_times')
+  assert Interpreter(m, list('99')).execute().status == Interpreter.ACCEPT
+  gc.collect()
+  assert State.instances.created > 16 and len(State.instances) <= 8 + 1
+
+def test_instance_names(tmp_path):
+  from amc import buildIR
+  from amc.ir import State
+  from amc.runtime import Interpreter
+  # Imbrication profonde, puis arguments partagés : les noms restent courts
+  for src, tape in [
+    ('Count(_S)\n  1 P:0 -> Count(Back(_S))\n\nBack(_S)\n  ... <- _S\n\ninit\n  Count(STOP(ACCEPT))\n', '1' * 1500),
+    ('Dup(_S)\n  a P: -> Dup(Pair(_S, _S))\n\nPair(_S, _T)\n  ... _S\n\ninit\n  Dup(STOP(ACCEPT))\n', 'a' * 24),
+  ] :
+    path = tmp_path / 'names.amachine'
+    path.write_text(src)
+    with open(path) as f :
+      m = buildIR(f, path)
+    i = Interpreter(m, list(tape))
+    assert i.execute().status == Interpreter.REJECT
+    assert len(i.previous_state.name) < 2 * State.NAME_LENGTH and '…' in i.previous_state.name
+
+def test_transition_cache(machine):
+  m = machine('01_n_times')
+  s = m.init_state.instanciate()
+  code = m.alphabet.encode('2')
+  t = s.transition(code, m.alphabet)
+  assert t is s.transition(code, m.alphabet)
+  assert t.state is s.instanciate_rule('2').finalState
+
+def test_symbol_heads():
+  from amc.ir import State, DynRule, StaticStateReference
+  r = DynRule([], StaticStateReference(State.ACCEPT, tuple()))
+  assert State('T', ('_a',), {'x': r, '_a': r}).symbol_heads(('x',)) == {'x': '_a', '_a': None}
+  assert State('T', ('_a',), {'_a': r, 'x': r}).symbol_heads(('x',)) == {'_a': None}
+
+def test_slots(machine):
+  from amc.ir import StatePlaceholder, SymbolPlaceholder
+  m = machine('01_n_times')
+  gonext = next(s for s in m.states if s.name == 'GONext')
+  assert gonext.args == ['_a', '_S']
+  ph = gonext.rules['_a'].finalState
+  assert isinstance(ph, StatePlaceholder) and ph.slot == 1
+  unit = next(s for s in m.states if s.name == 'Unit')
+  ref = unit.default_rule.finalState.args[1]
+  assert isinstance(ref.args[0], SymbolPlaceholder) and ref.args[0].slot == 1
+
+def test_interned_nodes(machine):
+  from amc.ir import ActionPrint
+  assert ActionPrint('x') is ActionPrint('x')
+  m = machine('01_n_times')
+  rules = [ r for s in m.states for r in s.rules.values() ]
+  assert len({ id(r) for r in rules }) < len(rules)
+  s = m.init_state.instanciate()
+  assert not hasattr(s, '__dict__') and not hasattr(rules[0], '__dict__')
+
+def test_observers(machine):
+  from amc.runtime import Interpreter, Event
+  m = machine('01_n_times')
+  i = Interpreter(m, list('25'))
+  states = []
+  i.observe(states.extend, Event.STATE, every=10)
+  assert i.execute().status == Interpreter.ACCEPT
+  assert [ e[1] for e in states ] == list(range(10, i.steps + 1, 10))
+  i2 = Interpreter(m, list('25'))
+  batches = []
+  i2.observe(batches.append, Event.ACTION | Event.HALT, batch=100)
+  assert i2.execute().status == Interpreter.ACCEPT
+  assert i2.steps == i.steps and i2.symbols() == i.symbols()
+  assert all( len(b) == 100 for b in batches[:-1] )
+  assert batches[-1][-1][0] == Event.ACCEPT
+
+def list_move(tape, head, delta, keep):
+  """
+  Modèle de référence du ruban (l'ancienne implémentation par liste)
+  """
+  if delta < 0 :
+    if not keep and head == len(tape) - 1 and not tape[-1] :
+      del tape[-1]
+    head -= 1
+    if head < 0 :
+      tape[:0] = [0] * (-head)
+      head = 0
+  else :
+    if not keep and head == 0 and not tape[0] :
+      del tape[0]
+    else :
+      head += 1
+    if len(tape) <= head :
+      tape[len(tape):] = [0] * (head - len(tape) + 1)
+  return head
+
+@pytest.mark.parametrize('backend', ['buffer', 'rle', 'chunked', 'mmap'])
+@pytest.mark.parametrize('keep', [False, True])
+def test_tape(keep, backend):
+  import random
+  from amc.tape import TAPE_BACKENDS
+  rnd = random.Random(42)
+  ref = [1, 2, 3]
+  tape = TAPE_BACKENDS[backend](ref)
+  head = ref_head = 1
+  for _ in range(5000) :
+    if rnd.random() < 0.3 :
+      s = rnd.choice([0, 0, 1, 2])
+      ref[ref_head] = s
+      tape[head] = s
+    else :
+      delta = rnd.choice([-1, 1])
+      ref_head = list_move(ref, ref_head, delta, keep)
+      head = tape.move(head, delta, keep)
+    assert head == ref_head and list(tape) == ref
+  assert tape[1:4] == ref[1:4]
+
+def test_wide_tape():
+  from amc.tape import Tape
+  tape = Tape([1, 2])
+  assert isinstance(tape.cells, bytearray)
+  tape.widen()
+  tape[0] = 300
+  head = tape.move(0, -1)
+  assert head == 0 and list(tape) == [0, 300, 2]
+  assert Tape([300]).wide
+
+def test_rle_tape():
+  from amc.tape import RLETape
+  tape = RLETape([1, 1, 2])
+  tape.grow_right(10**6)
+  tape.grow_left(10**6)
+  tape[10**6 + 3] = 1
+  assert len(tape.codes) == 5 and len(tape) == 2 * 10**6 + 3
+  assert tape[10**6 - 1:10**6 + 5] == [0, 1, 1, 2, 1, 0]
+
+def test_mmap_tape():
+  from amc.tape import MmapTape
+  tape = MmapTape([1, 2])
+  tape.grow_left(10**7)
+  tape[0] = 3
+  fork = tape.fork()
+  fork.widen()
+  fork[1] = 300
+  assert len(tape) == 10**7 + 2 and tape[:2] == [3, 0] and tape[-2:] == [1, 2]
+  assert fork[:2] == [3, 300] and fork[-2:] == [1, 2] and fork.position(0) == -10**7
+
+@pytest.mark.parametrize('keep', [False, True])
+def test_mmap_fast(machine, monkeypatch, keep):
+  from amc.runtime import Interpreter
+  m = machine('01_n_times')
+  i = Interpreter(m, list('25'))
+  i.keep_unused_tape = keep
+  i.execute()
+  monkeypatch.setattr(Interpreter, 'run_tape', None) # La boucle rapide doit lire le tampon directement
+  i2 = Interpreter(m, list('25'), tape_backend='mmap')
+  i2.keep_unused_tape = keep
+  i2.execute()
+  assert (i2.steps, i2.head, i2.state, i2.symbols()) == (i.steps, i.head, i.state, i.symbols())
+
+def test_chunked_tape():
+  from amc.tape import ChunkedTape
+  tape = ChunkedTape([1, 2])
+  tape.grow_right(1000)
+  tape[600] = 3
+  fork = tape.fork()
+  fork[0] = 4
+  tape[601] = 5
+  assert tape.pages is not fork.pages and tape.pages[0] is not fork.pages[0]
+  assert tape[0:2] == [1, 2] and fork[0:2] == [4, 2]
+  assert (tape[600], tape[601], fork[600], fork[601]) == (3, 5, 3, 0)
+
+@pytest.mark.parametrize('backend', ['buffer', 'rle', 'chunked', 'mmap'])
+def test_fork(machine, backend):
+  from amc.runtime import Interpreter
+  m = machine('01_n_times')
+  ref = {}
+  for digits in ('25', '27') :
+    i = Interpreter(m, list(digits))
+    ref[digits] = (i.execute().status, i.steps, i.symbols())
+  # Le second chiffre n'est pas encore lu après le premier pas
+  i = Interpreter(m, list('25'), tape_backend=backend)
+  i.run(max_steps=1)
+  fork = i.fork()
+  fork.tape[1] = m.alphabet.encode('7')
+  assert (i.execute().status, i.steps, i.symbols()) == ref['25']
+  assert (fork.execute().status, fork.steps, fork.symbols()) == ref['27']
+
+@pytest.mark.parametrize('backend', ['buffer', 'rle', 'chunked', 'mmap'])
+def test_exec_tape_backend(cli, backend):
+  with pytest.raises(SystemExit, match='0'):
+    cli.main(['exec', '--tape-backend', backend, '-c', '25', './examples/01_n_times.amachine'])
+
+@pytest.mark.parametrize('backend', ['buffer', 'rle', 'chunked', 'mmap'])
+def test_scan(backend):
+  from amc.tape import TAPE_BACKENDS
+  tape = TAPE_BACKENDS[backend]([1, 1, 1, 2, 1, 1, 3, 1])
+  assert tape.scan(0, 1, b'\x02\x03', 100) == 3
+  assert tape.scan(4, 1, b'\x02\x03', 100) == 6
+  assert tape.scan(4, 1, b'\x02\x03', 1) == 5
+  assert tape.scan(7, -1, b'\x02\x03', 100) == 6
+  assert tape.scan(2, -1, b'\x02', 100) == 0
+  assert tape.scan(0, 1, b'', 100) == 7
+
+def test_sweeps(machine):
+  from amc.runtime import Interpreter, Event
+  m = machine('01_n_times')
+  gonext = next(s for s in m.states if s.name == 'GONext')
+  s = gonext.instanciate(('1', m.init_state))
+  assert s.sweep_stops(1, m.alphabet) == bytes([m.alphabet.encode('1')])
+  assert s.sweep_stops(-1, m.alphabet) is None
+  i = Interpreter(m, list('25'))
+  i.execute()
+  i2 = Interpreter(m, list('25'))
+  i2.observe(lambda events: None, Event.ACTION)
+  i2.execute()
+  assert i2.steps == i.steps and i2.symbols() == i.symbols()
+
+@pytest.mark.parametrize('block_size', [1, 3, 8])
+def test_macro(machine, block_size):
+  from amc.runtime import Interpreter, MacroInterpreter
+  m = machine('01_n_times')
+  i = Interpreter(m, list('25'))
+  i.execute()
+  i2 = MacroInterpreter(m, list('25'), block_size=block_size)
+  i2.execute()
+  assert (i2.steps, i2.head, i2.state, i2.symbols()) == (i.steps, i.head, i.state, i.symbols())
+  assert i2.memo
+
+def test_exec_macro(cli):
+  with pytest.raises(SystemExit, match='0'):
+    cli.main(['exec', '--engine', 'macro', '--block-size', '4', '-c', '25', './examples/01_n_times.amachine'])
+
+def test_engines(machine):
+  from amc.runtime import Event, Interpreter, ReferenceInterpreter, select_engine, create_interpreter
+  assert select_engine() is Interpreter
+  assert select_engine('auto', Event.ACTION | Event.STATE) is Interpreter
+  m = machine('01_n_times')
+  results = []
+  for engine in ('fast', 'macro', 'reference') :
+    i = create_interpreter(m, list('25'), engine, block_size=4)
+    results.append((i.execute().status, i.steps, i.head, i.symbols()))
+  assert isinstance(i, ReferenceInterpreter) and results[1:] == results[:-1]
+
+@pytest.mark.parametrize('mode', ['flat', 'closure'])
+@pytest.mark.parametrize('m, tape', [
+  ('tm', 'a'),
+  ('01_n_times', '25'),
+  ('interlace', 'abcdef'),
+])
+def test_compile_standalone(machine, tmp_path, m, tape, mode):
+  import importlib.util
+  from io import StringIO
+  from amc.runtime import Interpreter
+  from amc.targets.python import PythonTarget
+  amachine = machine(m)
+  path = tmp_path / f'{m}.py'
+  with open(path, 'w') as f :
+    PythonTarget(mode=mode).dump(amachine, f, path.name)
+  source = path.read_text()
+  assert 'import amc' not in source and 'from amc' not in source
+  spec = importlib.util.spec_from_file_location(m, path)
+  compiled = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(compiled)
+  for keep in (False, True) :
+    for limit in (None, 7) :
+      i = Interpreter(amachine, list(tape))
+      i.keep_unused_tape = keep
+      res = i.run(max_steps=limit)
+      rv = compiled.run(list(tape), keep, -1 if limit is None else limit)
+      assert rv[1:] == (i.state.name, None, i.symbols(), i.steps)
+      assert rv[0] == (compiled.STOPPED if res == Interpreter.SUSPENDED else res)
+
+@pytest.mark.parametrize('mode', ['flat', 'closure'])
+@pytest.mark.parametrize('init', ['STOP(ACCEPT)', 'STOP(REJECT)'])
+def test_compile_halting_init(tmp_path, mode, init):
+  import importlib.util
+  from amc import buildIR
+  from amc.runtime import Interpreter
+  from amc.targets.python import PythonTarget
+  path = tmp_path / 'halt.amachine'
+  path.write_text(f'A\n  x -> A\n\ninit\n  {init}\n')
+  with open(path) as f :
+    amachine = buildIR(f, path)
+  with open(tmp_path / 'halt.py', 'w') as f :
+    PythonTarget(mode=mode).dump(amachine, f, 'halt.py')
+  spec = importlib.util.spec_from_file_location('halt', tmp_path / 'halt.py')
+  compiled = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(compiled)
+  i = Interpreter(amachine, list('xx'))
+  status = i.execute().status
+  assert status == (Interpreter.ACCEPT if init == 'STOP(ACCEPT)' else Interpreter.REJECT) and i.steps == 0
+  assert compiled.run(list('xx')) == (status, i.state.name, None, i.symbols(), 0)
+
+def test_compile_unbounded(tmp_path):
+  import importlib.util
+  from io import StringIO
+  from amc import buildIR
+  from amc.runtime import Interpreter
+  from amc.targets.python import PythonTarget
+  # Chaque 1 lu imbrique la continuation un peu plus : les instances ne sont pas en nombre fini
+  path = tmp_path / 'nest.amachine'
+  path.write_text('symbols\n  0\n  1\n\nCount(_S)\n  1 P:0 -> Count(Back(_S))\n    _S\n\nBack(_S)\n  ... <- _S\n\ninit\n  Count(STOP(ACCEPT))\n')
+  with open(path) as f :
+    amachine = buildIR(f, path)
+  with pytest.raises(ValueError):
+    PythonTarget(mode='flat', max_states=20).dump(amachine, StringIO(), 'nest.py')
+  with open(tmp_path / 'nest.py', 'w') as f :
+    PythonTarget(mode='closure').dump(amachine, f, 'nest.py')
+  spec = importlib.util.spec_from_file_location('nest', tmp_path / 'nest.py')
+  compiled = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(compiled)
+  i = Interpreter(amachine, list('1' * 40))
+  i.keep_unused_tape = True
+  assert i.execute().status == Interpreter.ACCEPT
+  assert compiled.run(list('1' * 40), True) == (compiled.ACCEPT, i.state.name, None, i.symbols(), i.steps)
+  # Instance profonde : nom abrégé comme par l'interpréteur
+  i = Interpreter(amachine, list('1' * 1500))
+  res = i.run(max_steps=1500)
+  assert compiled.run(list('1' * 1500), False, 1500) == (compiled.STOPPED, i.state.name, None, i.symbols(), i.steps)
+  assert res == Interpreter.SUSPENDED and '…' in i.state.name
+
+def test_exec_engine(cli):
+  with pytest.raises(SystemExit, match='0'):
+    cli.main(['exec', '--engine', 'reference', '-t', '-c', '25', './examples/01_n_times.amachine'])
+
+def test_visualizer(cli, capsys):
+  from amc.runtime import Visualizer
+  shown = []
+  v = Visualizer(shown.append)
+  v.offer(1)
+  v.offer(2)
+  v.start()
+  v.close()
+  assert shown == [2]
+  with pytest.raises(SystemExit, match='0'):
+    cli.main(['exec', '-a', '-t', '--fps', '1000', '-c', '25', './examples/01_n_times.amachine'])
+  assert 'STATE\n' in capsys.readouterr().out
+
+@pytest.mark.parametrize('engine', ['fast', 'macro', 'reference'])
+@pytest.mark.parametrize('backend', ['buffer', 'rle'])
+def test_breakpoints(machine, engine, backend):
+  from amc.ir import StateInstance
+  from amc.runtime import Interpreter, create_interpreter
+  m = machine('01_n_times')
+  trace = []
+  i = create_interpreter(m, list('25'), 'reference')
+  i.state_cb = lambda i: trace.append((i.steps, i.state.template.name if isinstance(i.state, StateInstance) else i.state.name, i.read_tape(), len(i.tape)))
+  res = i.execute().status
+  # GONext avance sur le 5 sans écrire : le balayage ne doit pas sauter le point d'arrêt
+  hits = [ t[0] for t in trace if t[1] == 'GONext' and t[2] == '5' ]
+  assert hits[0] == 2 and len(hits) == 2
+  i = create_interpreter(m, list('25'), engine, tape_backend=backend)
+  i.set_breakpoints([('GONext', '5')], step=3, tape_len=11)
+  stops = []
+  while (r := i.execute().status) == Interpreter.BREAK :
+    stops.append(i.steps)
+  assert (r, i.steps) == (res, trace[-1][0])
+  assert stops == [1, 2, 3, hits[1]]
+
+@pytest.mark.parametrize('backend', ['buffer', 'chunked'])
+def test_recorder(machine, monkeypatch, backend):
+  from amc.runtime import Interpreter, Recorder
+  from amc.tape import ChunkedTape
+  monkeypatch.setattr(ChunkedTape, 'SHIFT', 2)
+  monkeypatch.setattr(ChunkedTape, 'PAGE_SIZE', 4)
+  monkeypatch.setattr(ChunkedTape, 'MASK', 3)
+  m = machine('01_n_times')
+  trace = {}
+  i = Interpreter(m, list('25'))
+  i.state_cb = lambda i: trace.__setitem__(i.steps, (i.state, i.head, i.symbols()))
+  i.execute()
+  i = Interpreter(m, list('25'), tape_backend=backend)
+  recorder = Recorder(i, every=10, size=4)
+  i.execute()
+  recorder.record(i)
+  assert len(recorder.snapshots) == 4 and recorder.last == i.steps
+  # Les copies partagent les pages qu'elles ont en commun
+  a, b = recorder.snapshots[-2].tape.pages, recorder.snapshots[-1].tape.pages
+  assert any( a[p] is b.get(p) for p in a )
+  for step in (recorder.first, recorder.first + 7, recorder.last - 1, recorder.last) :
+    view = recorder.seek(step)
+    assert view.steps == step and (view.state, view.head, view.symbols()) == trace[step]
+  assert recorder.seek(0).steps == recorder.first
+
+def test_progress(machine, monkeypatch, capsys):
+  import os, signal
+  from amc.runtime import CLI, Interpreter
+  m = machine('01_n_times')
+  i = Interpreter(m, list('25'))
+  monkeypatch.setattr(Interpreter, 'RUN_BATCH', 16)
+  i.state_cb = lambda i: i.steps == 40 and os.kill(os.getpid(), signal.SIGUSR1)
+  assert CLI(m).run_monitored(i, None, 0, 0) == Interpreter.ACCEPT
+  lines = capsys.readouterr().err.splitlines()
+  assert len(lines) == 1 and lines[0].startswith('[progress] step 48 ')
+  p = i.progress()
+  assert p['steps'] == i.steps and p['stop'] - p['start'] == len(i.tape) and p['created'] >= p['instances']
+
+@pytest.mark.parametrize('engine', ['fast', 'macro', 'reference'])
+@pytest.mark.parametrize('backend', ['buffer', 'rle', 'chunked'])
+def test_stats(machine, engine, backend):
+  from amc.ir import Action
+  from amc.runtime import Interpreter, create_interpreter
+  m = machine('01_n_times')
+  i = Interpreter(m, list('25'))
+  seen = []
+  i.action_cb = lambda i: seen.append((i.cur_act, i.tape.position(i.head), len(i.tape)))
+  i.execute()
+  positions = [0, 1] + [ p for a, p, n in seen ]
+  expected = (
+    len(seen), sum( 1 for a, p, n in seen if a is not Action.LEFT and a is not Action.RIGHT ),
+    min(positions), max(positions), max( n for a, p, n in seen ),
+  )
+  i = create_interpreter(m, list('25'), engine, tape_backend=backend, block_size=4)
+  stats = i.execute()
+  assert stats.status == Interpreter.ACCEPT and stats.steps == i.steps and stats.elapsed > 0
+  assert (stats.actions, stats.prints, stats.min_pos, stats.max_pos, stats.peak_tape) == expected
+  assert stats.todict()['status'] == 'ACCEPT'
+  i.counts = 1 << 41 # Plus d'actions que ne le permettait un décalage de 40 bits
+  assert (i.actions, i.prints) == (1 << 41, 0)
+
+def test_exec_stats(cli, capsys):
+  import json
+  with pytest.raises(SystemExit, match='0'):
+    cli.main(['exec', '--stats', '--json', '-c', '25', './examples/01_n_times.amachine'])
+  stats = json.loads(capsys.readouterr().out.splitlines()[-1])
+  assert stats['status'] == 'ACCEPT' and stats['steps'] > 0
+
+def test_detect_cycles(tmp_path):
+  from amc import buildIR
+  from amc.runtime import Interpreter, Event, prime_factors
+  assert prime_factors(360) == [2, 2, 2, 3, 3, 5]
+  path = tmp_path / 'loop.amachine'
+  path.write_text('A\n  x -> B\n  ... P:x A\n\nB\n  y <- A\n  ... P:y -> C\n\nC\n  ... <- <- A\n\ninit\n  A\n')
+  with open(path) as f :
+    m = buildIR(f, path)
+  i = Interpreter(m, list('xx'))
+  i.detect_cycles = True
+  assert i.execute().status == Interpreter.LOOPING
+  assert i.cycle_length == 2 and i.cycle_start <= i.steps
+  ref = Interpreter(m, list('xx'))
+  seen = {}
+  while ref.configuration() not in seen :
+    seen[ref.configuration()] = ref.steps
+    ref.run_fast(ref.steps + 1)
+  assert i.cycle_start == seen[ref.configuration()]
+  i = Interpreter(m, list('xx'))
+  i.detect_cycles = True
+  i.observe(lambda events: None, Event.STATE, every=1000000)
+  assert i.execute().status == Interpreter.LOOPING and i.cycle_length == 2
+
+@pytest.mark.parametrize('backend', ['buffer', 'rle', 'chunked', 'mmap'])
+def test_checkpoint(machine, tmp_path, monkeypatch, backend):
+  import os
+  from amc import checkpoint
+  from amc.runtime import Interpreter, Event
+  monkeypatch.setattr(checkpoint, 'PAGE_SIZE', 4)
+  m = machine('01_n_times')
+  i = Interpreter(m, list('25'))
+  stats = i.execute()
+  path = str(tmp_path / 'ck')
+  i2 = Interpreter(m, list('25'), tape_backend=backend)
+  i2.observe(lambda events: i2.checkpoint(path), Event.STATE, every=37)
+  i2.execute()
+  records = list(checkpoint.read_records(path))
+  assert len(records) == i.steps // 37
+  assert any( len(r['pages']) < r['length'] // 4 for r in records[1:] )
+  i3 = Interpreter(m, [], tape_backend=backend)
+  i3.resume(path)
+  assert i3.steps == records[-1]['steps']
+  assert i3.execute()[:7] == stats[:7]
+  assert (i3.steps, i3.head, i3.state, i3.symbols()) == (i.steps, i.head, i.state, i.symbols())
+  # Dernier enregistrement interrompu : la reprise repart du précédent et l'écrase
+  with open(path, 'r+b') as f :
+    f.truncate(os.path.getsize(path) - 3)
+  i4 = Interpreter(m, [], tape_backend=backend)
+  i4.resume(path)
+  assert i4.steps == records[-2]['steps']
+  i4.observe(lambda events: i4.checkpoint(path), Event.STATE, every=37)
+  i4.execute()
+  assert [ r['steps'] for r in checkpoint.read_records(path) ] == [ r['steps'] for r in records ]
+  assert (i4.steps, i4.head, i4.state, i4.symbols()) == (i.steps, i.head, i.state, i.symbols())
+
+def test_checkpoint_instances(tmp_path):
+  from amc import buildIR, checkpoint
+  from amc.runtime import Interpreter
+  # Instances partagées, puis imbrication plus profonde que la limite de récursion
+  for src, tape, rows in [
+    ('Dup(_S)\n  a P: -> Dup(Pair(_S, _S))\n\nPair(_S, _T)\n  ... _S\n\ninit\n  Dup(STOP(ACCEPT))\n', 'a' * 40, 43),
+    ('Count(_S)\n  1 P:0 -> Count(Back(_S))\n\nBack(_S)\n  ... <- _S\n\ninit\n  Count(STOP(ACCEPT))\n', '1' * 1500, 1503),
+  ] :
+    path = tmp_path / 'nest.amachine'
+    path.write_text(src)
+    with open(path) as f :
+      m = buildIR(f, path)
+    i = Interpreter(m, list(tape))
+    i.run(max_steps=len(tape))
+    ck = str(tmp_path / f'{len(tape)}.ck')
+    i.checkpoint(ck)
+    assert len(next(checkpoint.read_records(ck))['states']) == rows
+    i2 = Interpreter(m, [])
+    i2.resume(ck)
+    assert (i2.state, i2.previous_state) == (i.state, i.previous_state)
+
+def test_run_limits(machine):
+  import time
+  from amc.runtime import Interpreter
+  m = machine('01_n_times')
+  i = Interpreter(m, list('25'))
+  i.execute()
+  i2 = Interpreter(m, list('25'))
+  i2.detect_cycles = True
+  while i2.run(max_steps=100) == Interpreter.SUSPENDED :
+    assert i2.steps % 100 == 0
+  assert (i2.steps, i2.head, i2.state, i2.symbols()) == (i.steps, i.head, i.state, i.symbols())
+  i3 = Interpreter(m, list('25'))
+  i3.RUN_BATCH = 50
+  assert i3.run(deadline=time.monotonic() - 1) == Interpreter.SUSPENDED and i3.steps == 50
+  assert i3.run(max_tape=10) == Interpreter.SUSPENDED and len(i3.tape) > 10
+  assert i3.run() == Interpreter.ACCEPT and i3.steps == i.steps
+
+@pytest.mark.parametrize('backend', ['buffer', 'rle'])
+@pytest.mark.parametrize('keep', [False, True])
+def test_fused_actions(machine, keep, backend):
+  from amc.ir import Action
+  from amc.runtime import Interpreter, Event
+  m = machine('01_n_times')
+  s = m.init_state.instanciate()
+  t = s.transition(m.alphabet.encode('2'), m.alphabet)
+  assert t.fused and t.delta == t.ops.count(Action.RIGHT) - t.ops.count(Action.LEFT)
+  assert all( t.lo <= o <= t.hi for o, c in t.writes )
+  i = Interpreter(m, list('25'), tape_backend=backend)
+  i.keep_unused_tape = keep
+  i.execute()
+  i2 = Interpreter(m, list('25'), tape_backend=backend)
+  i2.keep_unused_tape = keep
+  i2.observe(lambda events: None, Event.ACTION)
+  i2.execute()
+  assert (i2.steps, i2.head, i2.symbols()) == (i.steps, i.head, i.symbols())